@@ -10,7 +10,7 @@ package.name = soso
 package.domain = org.example
 
 # (str) Source code file to use as main entry point
-source.include_exts = py,png,jpg,kv,json,ttf
+source.include_exts = py,png,jpg,kv,json,ttf,bin
 
 # (list) Source files to include (optional)
 source.include_patterns = img/*,fonts/*
@@ -12,6 +12,7 @@ from kivy.app import App
 
 from shake_voice_handler import ShakeVoiceHandler
 import floating_button   # Floating button module
+from sms_manager import threat_escalator, EscalationRule
 
 # Global button settings
 BUTTON_SETTINGS = {
@@ -152,6 +153,31 @@ class ButtonSettingsScreen(Screen):
         security_box.add_widget(self.countdown_input_box)
         layout.add_widget(security_box)
 
+        # --- Threat SMS Escalation ---
+        rule = threat_escalator.rule
+        layout.add_widget(Label(text="Threat SMS Escalation", font_size=22, bold=True))
+        escalation_box = BoxLayout(orientation="vertical", spacing=8, size_hint_y=None)
+        escalation_box.bind(minimum_height=escalation_box.setter('height'))
+
+        escalate_chk_box = BoxLayout(orientation="horizontal", spacing=12, size_hint_y=None, height=35)
+        escalate_chk_box.add_widget(Label(text="Auto-SOS on Severe Threat SMS"))
+        self.escalate_chk = CheckBox(active=rule.enabled)
+        escalate_chk_box.add_widget(self.escalate_chk)
+        escalation_box.add_widget(escalate_chk_box)
+
+        escalation_box.add_widget(Label(text="Minimum Threat Confidence (%)", size_hint_y=None, height=30))
+        self.threat_slider = Slider(min=50, max=100, value=int(rule.min_threat * 100), step=1,
+                                    size_hint_y=None, height=50)
+        escalation_box.add_widget(self.threat_slider)
+
+        trigger_box = BoxLayout(orientation="horizontal", spacing=12, size_hint_y=None, height=45)
+        trigger_box.add_widget(Label(text="Trigger Words (comma separated)"))
+        self.trigger_input = TextInput(text=", ".join(rule.trigger_words), multiline=False,
+                                       size_hint_y=None, height=45)
+        trigger_box.add_widget(self.trigger_input)
+        escalation_box.add_widget(trigger_box)
+        layout.add_widget(escalation_box)
+
         # --- Save Button ---
         save_btn = Button(text="Save Settings", size_hint_y=None, height=55)
         save_btn.bind(on_release=self.save_settings)
@@ -273,6 +299,14 @@ class ButtonSettingsScreen(Screen):
         except ValueError:
             BUTTON_SETTINGS["countdown_seconds"] = 5
 
+        # Threat escalation rule (saved to its own file)
+        threat_escalator.set_rule(EscalationRule(
+            enabled=self.escalate_chk.active,
+            min_threat=self.threat_slider.value / 100.0,
+            trigger_words=self.trigger_input.text.split(","),
+            sos_category=threat_escalator.rule.sos_category,
+        ))
+
         # Update app-level settings
         self.app.button_settings = BUTTON_SETTINGS
 
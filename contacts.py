@@ -6,51 +6,46 @@ from kivy.uix.button import Button
 from kivy.uix.checkbox import CheckBox
 from kivy.uix.label import Label
 from kivy.uix.popup import Popup
-import json
-import os
 import platform
 
 from floating_button import enable_floating, send_sos_message
-
-
-DATA_FILE = "contacts.json"
-CATEGORIES = ["THREATS", "ACCIDENTS", "FIRE", "MEDICAL", "ONE TAP EMERGENCY"]
-
-# -------------------- Load Contacts --------------------
-def load_contacts_file():
-    if not os.path.exists(DATA_FILE):
-        return []
-    try:
-        with open(DATA_FILE, "r") as f:
-            data = json.load(f)
-        return [c for c in data if isinstance(c, dict) and "name" in c and "phone" in c and "categories" in c]
-    except:
-        return []
-
-contacts = load_contacts_file()
+from sos_dispatch import get_sms_manager, sos_outbox
+from contacts_repo import contacts_repo, CATEGORIES
 
 # -------------------- SMS Sending --------------------
+def get_category_recipients(category):
+    """Contacts in category, straight from the repository's index."""
+    return contacts_repo.recipients(category)
+
+def _log_fan_out(fan_out):
+    for r in fan_out.results:
+        c = r.recipient
+        if r.status == "sent":
+            print("SMS sent to:", c["name"], c["phone"])
+        else:
+            print("Failed sending to", c["phone"], "(queued for retry):", r.error)
+    print("SOS fan-out:", fan_out.report())
+
 def send_sms_to_category(category, message):
+    """
+    Send message to every contact in category concurrently, through the
+    durable outbox. Returns a FanOut handle (one SendResult per recipient
+    for the first attempt), or None if nothing was sent.
+    """
     is_android = (platform.system() == "Linux")
     if not is_android:
         print("SMS sending works only on Android.")
-        return
+        return None
     try:
-        from jnius import autoclass
-        SmsManager = autoclass("android.telephony.SmsManager").getDefault()
+        get_sms_manager()
     except Exception as e:
         print("Error initializing SMS API:", e)
-        return
-    group = [c for c in contacts if category in c["categories"]]
+        return None
+    group = get_category_recipients(category)
     if not group:
         print("No contacts found for category:", category)
-        return
-    for c in group:
-        try:
-            SmsManager.sendTextMessage(c["phone"], None, message, None, None)
-            print("SMS sent to:", c["name"], c["phone"])
-        except Exception as e:
-            print("Failed sending to", c["phone"], ":", e)
+        return None
+    return sos_outbox.send(group, message, on_complete=_log_fan_out)
 
 
 # -------------------- Contacts Screen --------------------
@@ -64,7 +59,7 @@ class ContactsScreen(Screen):
         self.setup_category_checkboxes()
         self.load_contacts()
         # Enable SOS floating button with live contacts
-        enable_floating(size=80, callback=lambda: send_sos_message(contacts))
+        enable_floating(size=80, callback=send_sos_message)
 
 
     # -------------------- Setup Main Category Checkboxes --------------------
@@ -104,7 +99,7 @@ class ContactsScreen(Screen):
         active_cats = [cat for cat, chk in self.category_checks.items() if chk.active]
         show_all = "ALL" in active_cats
 
-        filtered = [c for c in contacts if show_all or any(cat in c["categories"] for cat in active_cats)]
+        filtered = contacts_repo.all() if show_all else contacts_repo.in_categories(active_cats)
         if not filtered:
             grid.add_widget(Label(text="No contacts to display.", size_hint_y=None, height=30, color=(1,1,1,1)))
             return
@@ -162,15 +157,14 @@ class ContactsScreen(Screen):
             self.show_popup("Error", "Name, phone, and at least one category required!")
             return
 
-        global contacts
         data = {"name": name, "phone": phone, "categories": categories}
 
         if self.selected_contact is not None:
-            contacts[self.selected_contact] = data
+            contacts_repo.update(self.selected_contact, data)
             self.selected_contact = None
             self.ids.add_contact_btn.text = "Add Contact"
         else:
-            contacts.append(data)
+            contacts_repo.add(data)
 
         self.save_contacts()
         self.clear_fields()
@@ -209,7 +203,7 @@ class ContactsScreen(Screen):
         popup.open()
 
     def edit_contact(self, contact):
-        idx = contacts.index(contact)
+        idx = contacts_repo.index_of(contact)
         self.selected_contact = idx
         self.ids.name_input.text = contact["name"]
         self.ids.phone_input.text = contact["phone"]
@@ -219,12 +213,12 @@ class ContactsScreen(Screen):
         self.ids.add_contact_btn.text = "Update"
 
     def remove_contact(self, contact):
-        global contacts
-        contacts.remove(contact)
+        contacts_repo.remove(contact)
         self.save_contacts()
         self.load_contacts()
 
     def delete_saved_contact(self):
+        contacts = contacts_repo.all()
         if not contacts:
             self.show_popup("Info", "No saved contacts to delete.")
             return
@@ -239,7 +233,7 @@ class ContactsScreen(Screen):
         self._delete_popup = popup
 
     def confirm_delete(self, index):
-        contact = contacts.pop(index)
+        contact = contacts_repo.pop(index)
         self.save_contacts()
         self.load_contacts()
         if hasattr(self, "_delete_popup"):
@@ -262,8 +256,7 @@ class ContactsScreen(Screen):
     # -------------------- Save Contacts --------------------
     def save_contacts(self):
         try:
-            with open(DATA_FILE, "w") as f:
-                json.dump(contacts, f, indent=4)
+            contacts_repo.save()
         except Exception as e:
             self.show_popup("Error", f"Failed to save contacts: {e}")
 
@@ -0,0 +1,176 @@
+# contacts_repo.py
+import itertools
+import json
+import os
+import threading
+
+CONTACTS_FILE = "contacts.json"
+CATEGORIES = ["THREATS", "ACCIDENTS", "FIRE", "MEDICAL", "ONE TAP EMERGENCY"]
+
+
+def normalize_number(number):
+    """Compare numbers by their last 10 digits (drops +63 / 0 prefixes)."""
+    digits = "".join(ch for ch in (number or "") if ch.isdigit())
+    return digits[-10:]
+
+
+def _valid(contact):
+    return isinstance(contact, dict) and "name" in contact and "phone" in contact and "categories" in contact
+
+
+# -------------------------------------------------------
+# CONTACTS REPOSITORY
+# -------------------------------------------------------
+class ContactsRepository:
+    """
+    The saved contacts plus two lookups kept up to date on every change:
+    category -> recipients and the set of known phone numbers. The file is
+    read once; after that the SOS path only reads the in-memory indexes.
+
+    Recipient lists are handed out as tuples that are replaced (not
+    modified) on change, so a caller holding one never sees it change.
+    Mutators only update memory; call save() to write contacts.json.
+    """
+
+    def __init__(self, path=CONTACTS_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._contacts = []
+        self._by_category = {}  # category -> tuple of contacts, in list order
+        self._numbers = {}      # normalized phone -> number of contacts using it
+        self._order = {}        # id(contact) -> insertion sequence number
+        self._seq = itertools.count()
+
+    # ---------------- Load / Save ----------------
+    def load(self):
+        """(Re)read contacts.json and rebuild the indexes."""
+        contacts = []
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    contacts = [c for c in json.load(f) if _valid(c)]
+            except (OSError, ValueError, TypeError):
+                contacts = []
+        with self._lock:
+            self._contacts = []
+            self._by_category = {}
+            self._numbers = {}
+            self._order = {}
+            for c in contacts:
+                self._append(c)
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+
+    def save(self):
+        """Write the contacts to disk (raises OSError on failure)."""
+        with self._lock:
+            data = list(self._contacts)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    # ---------------- Index Maintenance ----------------
+    def _index(self, contact):
+        for cat in set(contact["categories"]):
+            group = self._by_category.get(cat, ())
+            if group and self._order[id(group[-1])] > self._order[id(contact)]:
+                # Re-inserted contact keeps its place in the list order
+                group = tuple(sorted(group + (contact,), key=lambda c: self._order[id(c)]))
+            else:
+                group = group + (contact,)
+            self._by_category[cat] = group
+        number = normalize_number(contact["phone"])
+        if number:
+            self._numbers[number] = self._numbers.get(number, 0) + 1
+
+    def _unindex(self, contact):
+        for cat in set(contact["categories"]):
+            group = tuple(c for c in self._by_category.get(cat, ()) if c is not contact)
+            if group:
+                self._by_category[cat] = group
+            else:
+                self._by_category.pop(cat, None)
+        number = normalize_number(contact["phone"])
+        if number in self._numbers:
+            self._numbers[number] -= 1
+            if not self._numbers[number]:
+                del self._numbers[number]
+
+    def _append(self, contact):
+        self._contacts.append(contact)
+        self._order[id(contact)] = next(self._seq)
+        self._index(contact)
+
+    # ---------------- Changes ----------------
+    def add(self, contact):
+        self._ensure_loaded()
+        with self._lock:
+            self._append(contact)
+
+    def update(self, index, contact):
+        """Replace the contact at index (its position in all() is kept)."""
+        self._ensure_loaded()
+        with self._lock:
+            old = self._contacts[index]
+            self._unindex(old)
+            self._order[id(contact)] = self._order.pop(id(old))
+            self._contacts[index] = contact
+            self._index(contact)
+
+    def pop(self, index):
+        self._ensure_loaded()
+        with self._lock:
+            contact = self._contacts.pop(index)
+            self._unindex(contact)
+            self._order.pop(id(contact), None)
+            return contact
+
+    def remove(self, contact):
+        with self._lock:
+            return self.pop(self.index_of(contact))
+
+    # ---------------- Lookups ----------------
+    def all(self):
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._contacts)
+
+    def index_of(self, contact):
+        """Position of this exact contact dict in all()."""
+        self._ensure_loaded()
+        with self._lock:
+            for i, c in enumerate(self._contacts):
+                if c is contact:
+                    return i
+            return self._contacts.index(contact)
+
+    def recipients(self, category):
+        """Tuple of contacts in category, without scanning the list."""
+        self._ensure_loaded()
+        return self._by_category.get(category, ())
+
+    def in_categories(self, categories):
+        """Contacts in any of categories, in list order."""
+        self._ensure_loaded()
+        with self._lock:
+            found = {}
+            for cat in categories:
+                for c in self._by_category.get(cat, ()):
+                    found[id(c)] = c
+            return sorted(found.values(), key=lambda c: self._order[id(c)])
+
+    def has_number(self, phone):
+        """True if phone (any format) belongs to a saved contact."""
+        self._ensure_loaded()
+        number = normalize_number(phone)
+        return bool(number) and number in self._numbers
+
+
+contacts_repo = ContactsRepository()
@@ -1,4 +1,7 @@
-import sys, platform, json, os
+import sys, platform
+
+from contacts_repo import contacts_repo
+from sos_message import build_sos_message
 
 IS_ANDROID = platform.system() == "Linux" and "ANDROID_ARGUMENT" in sys.argv
 IS_WINDOWS = platform.system() == "Windows"
@@ -26,17 +29,26 @@ if IS_ANDROID:
 
 # -------------------- SMS SENDING --------------------
 def send_sms(number, message):
-    """Send SMS to a phone number. Works on Android only; prints on Windows."""
+    """
+    Send SMS to a phone number. On Android it goes through the durable SOS
+    outbox (retried until delivered to the radio); prints on Windows.
+    """
+    send_sms_many([{"name": "", "phone": number}], message)
+
+def send_sms_many(recipients, message):
+    """Send one message to several {"name", "phone"} recipients at once."""
     if IS_ANDROID:
-        try:
-            from jnius import autoclass
-            SmsManager = autoclass("android.telephony.SmsManager").getDefault()
-            SmsManager.sendTextMessage(number, None, message, None, None)
-            print(f"SMS sent to {number}")
-        except Exception as e:
-            print(f"Failed to send SMS to {number}: {e}")
-    else:
-        print(f"[SIMULATION] SMS to {number}: {message}")
+        from sos_dispatch import sos_outbox
+        return sos_outbox.send(recipients, message, on_complete=_log_results)
+    for r in recipients:
+        print(f"[SIMULATION] SMS to {r['phone']}: {message}")
+
+def _log_results(fan_out):
+    for r in fan_out.results:
+        if r.status == "sent":
+            print(f"SMS sent to {r.recipient['phone']}")
+        else:
+            print(f"Failed to send SMS to {r.recipient['phone']} (queued for retry): {r.error}")
 
 # -------------------- LOCATION FETCHING --------------------
 def fetch_current_location(callback=None):
@@ -70,23 +82,17 @@ def fetch_current_location(callback=None):
 
 # -------------------- CONTACTS --------------------
 def fetch_contacts():
-    path = "contacts.json"
-    if os.path.exists(path):
-        try:
-            with open(path, "r") as f:
-                return json.load(f)
-        except: return {}
-    return {}
+    return contacts_repo.all()
 
 def fetch_one_tap_emergency(contacts_list=None):
-    if contacts_list is None: contacts_list = fetch_contacts()
+    # Shared in-memory index: no file read or list scan on the SOS path
+    if contacts_list is None: return contacts_repo.recipients("ONE TAP EMERGENCY")
     return [c for c in contacts_list if "ONE TAP EMERGENCY" in c.get("categories", [])]
 
 def send_sos_message(contacts_list=None):
     def send(lat, lon):
-        message = f"SOS! My location: {lat},{lon}" if lat and lon else "SOS! Location unknown."
-        for c in fetch_one_tap_emergency(contacts_list):
-            send_sms(c["phone"], message)
+        message = build_sos_message(lat=lat, lon=lon) if lat and lon else build_sos_message()
+        send_sms_many(fetch_one_tap_emergency(contacts_list), message)
     fetch_current_location(send)
 
 # -------------------- FLOATING BUTTON --------------------
@@ -0,0 +1,96 @@
+# keyword_matcher.py
+from collections import deque
+
+
+# -------------------------------------------------------
+# MULTI-PATTERN KEYWORD MATCHER (AHO-CORASICK)
+# -------------------------------------------------------
+class KeywordMatcher:
+    """
+    Finds every keyword in a text in one left-to-right pass, no matter how
+    many keywords there are. Build it once from the keyword list and rebuild
+    it when the list changes.
+
+    keywords: an iterable of strings, or a dict of keyword -> label
+    (e.g. "spam" / "threat"). Matching is case-insensitive.
+    """
+
+    def __init__(self, keywords=()):
+        if isinstance(keywords, dict):
+            items = keywords.items()
+        else:
+            items = ((kw, None) for kw in keywords)
+
+        # State 0 is the root. goto[s] maps a character to the next state,
+        # out[s] lists (keyword, label) pairs that end in state s.
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self.keywords = []
+
+        for kw, label in items:
+            kw = kw.strip().lower()
+            if kw:
+                self._insert(kw, label)
+        self._build_links()
+
+    def __len__(self):
+        return len(self.keywords)
+
+    # ---------------- Build ----------------
+    def _insert(self, keyword, label):
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+                self._goto[state][ch] = nxt
+            state = nxt
+        if all(kw != keyword for kw, _ in self._out[state]):
+            self._out[state] += ((keyword, label),)
+            self.keywords.append(keyword)
+
+    def _build_links(self):
+        # Breadth-first so every fail target is finished before it is used.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Inherit matches of the longest proper suffix
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    # ---------------- Match ----------------
+    def iter_matches(self, text):
+        """Yield (end_index, keyword, label) for every keyword occurrence."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text.lower()):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for kw, label in out[state]:
+                    yield i, kw, label
+
+    def search(self, text):
+        """Return the first keyword found in text, or None."""
+        for _, kw, _ in self.iter_matches(text):
+            return kw
+        return None
+
+    def find_all(self, text):
+        """Return the set of distinct keywords found in text."""
+        return {kw for _, kw, _ in self.iter_matches(text)}
+
+    def labels(self, text):
+        """Return the set of labels of the keywords found in text."""
+        return {label for _, _, label in self.iter_matches(text)}
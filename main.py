@@ -18,11 +18,14 @@ from kivymd.app import MDApp
 from plyer import notification
 from kivy.factory import Factory
 from kivy.utils import platform
-from sms_manager import init_db, read_sms_inbox, filter_messages, save_spam, get_grouped_spam, SMSReceiver
+from sms_manager import init_db, get_spam_counts, SMSReceiver, InboxImportWorker, threat_escalator
 import json, os
 
 from geopy.geocoders import Nominatim
 from contacts import ContactsScreen, send_sms_to_category
+from sos_dispatch import get_sms_manager
+from floating_button import fetch_current_location
+from sos_message import build_sos_message, segment_info
 from button_settings import ButtonSettingsScreen
 from help import HelpScreen
 from profile import ProfileScreen
@@ -64,6 +67,7 @@ class MainScreen(Screen):
         self.geolocator = Nominatim(user_agent="safe_map_app")
         self.recent_searches = []
         self.sms_receiver = None
+        self.import_worker = None
 
     # ---------------- Marker Reload ----------------
     def reload_markers(self):
@@ -93,6 +97,10 @@ class MainScreen(Screen):
 
         Clock.schedule_once(lambda dt: self.reload_markers(), 0)
 
+        # Severe threat SMS raise the SOS countdown directly
+        threat_escalator.add_prewarm(self.prewarm_sos)
+        threat_escalator.bind(self.on_threat_escalated)
+
         if platform == "android":
             Clock.schedule_once(lambda dt: self.setup_sms_monitoring(), 0)
         else:
@@ -102,13 +110,15 @@ class MainScreen(Screen):
 
     def setup_sms_monitoring(self):
         init_db()
-        
-        # Read inbox once
-        all_sms = read_sms_inbox()
-        filtered = filter_messages(all_sms)
-        save_spam(filtered)
         self.update_counter()
 
+        # Import inbox rows that arrived since the last launch in the background
+        self.import_worker = InboxImportWorker(
+            on_progress=self.on_import_progress,
+            on_complete=self.on_import_complete,
+        )
+        self.import_worker.start()
+
         # Real-time SMS listener (Android only)
         if platform == "android":
             from jnius import autoclass
@@ -122,22 +132,45 @@ class MainScreen(Screen):
         else:
             print("SMS monitoring skipped (not running on Android).")
     
-    def on_sms_received(self, sms_message):
+    def on_sms_received(self, delta=None):
+        """
+        Called on the main thread once per burst of new spam/threat messages
+        (already classified and saved); only the UI needs updating.
         """
-        Called by SMSReceiver when a new SMS arrives.
-        sms_message: dict with keys 'sender', 'message'
+        self.update_counter()
+
+    # ---------------- Threat Escalation ----------------
+    def prewarm_sos(self, category):
         """
-        # Check if spam using SpamDetailScreen keywords
-        if self.spam_screen and self.spam_screen.detect_spam(sms_message["message"]):
-            print("Blocked spam SMS:", sms_message["message"])
-            # Save spam locally
-            data = load_spam()
-            data.append({"message": sms_message["message"], "category": "spam"})
-            save_spam(data)
-            self.update_counter()
+        Runs on the SMS receiver thread: resolve the SMS API ahead of
+        report_all. Recipients are an index lookup, so they are read at send time.
+        """
+        if platform == "android":
+            get_sms_manager()
+
+    def on_threat_escalated(self, event):
+        """A severe threat SMS arrived: start the SOS countdown on this frame."""
+        if self.countdown_event:
+            return  # a countdown is already running
+        self.on_sos_pressed(event["sos_category"])
+        fetch_current_location(self.on_location_update)
+
+    def on_location_update(self, lat, lon):
+        if lat and lon:
+            self.current_lat = lat
+            self.current_lon = lon
+
+    def on_import_progress(self, scanned, saved):
+        if hasattr(self.ids, "spam_header"):
+            self.ids.spam_header.text = f"Importing SMS... {scanned} scanned"
+
+    def on_import_complete(self, saved, error):
+        if error:
+            print("SMS import stopped:", error)
+        self.update_counter()
 
     def update_counter(self):
-        data = get_grouped_spam()
+        data = get_spam_counts()
         if hasattr(self.ids, "spam_header"):
             header = self.ids.spam_header
             header.text = f"Spam: {data['spam']} | Threats: {data['threat']}"
@@ -225,6 +258,7 @@ class MainScreen(Screen):
         self.countdown_label.text = f"Sending {self.current_category} alert in {self.remaining_time} sec"
         if self.remaining_time <= 0:
             Clock.unschedule(self.countdown_event)
+            self.countdown_event = None
             if self.popup:
                 self.popup.dismiss()
             self.report_all()
@@ -232,13 +266,15 @@ class MainScreen(Screen):
 
     def cancel_countdown(self, instance):
         Clock.unschedule(self.countdown_event)
+        self.countdown_event = None
         if self.popup:
             self.popup.dismiss()
         print(f"{self.current_category} SOS cancelled.")
 
     def report_all(self):
-        msg = f"EMERGENCY ({self.current_category})! Location: https://maps.google.com/?q={self.current_lat},{self.current_lon}"
-        print(msg)
+        msg = build_sos_message(self.current_category, self.current_lat, self.current_lon)
+        encoding, units, segments = segment_info(msg)
+        print(f"{msg} [{encoding}, {units} units, {segments} SMS]")
         send_sms_to_category(self.current_category, msg)  # <-- this is the key
         notification.notify(
             title=f"SOS Sent: {self.current_category}",
@@ -1,8 +1,21 @@
+import hashlib
 import json
-from datetime import datetime
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
 from kivy.utils import platform
 from kivy.clock import Clock
 
+from keyword_matcher import KeywordMatcher
+from contacts_repo import contacts_repo, normalize_number
+from spam_scorer import SpamScorer, load_scorer, tokenize
+from sms_store import (
+    JournalStore, SQLiteStore, WriteBehindStore, CategoryCounters, DedupIndex, SearchIndex, SenderReputation,
+    ArchiveSummary, JsonReputationBacking, SQLiteReputationBacking, sqlite3, write_json_atomic, record_key,
+)
+
 # -------------------------------------------------------
 # PLATFORM CHECK
 # -------------------------------------------------------
@@ -30,134 +43,859 @@ else:
 # -------------------------------------------------------
 # LOCAL DATABASE (WORKS ON BOTH WIN + ANDROID)
 # -------------------------------------------------------
-DB_FILE = "spam_messages.json"
+# "journal": append-only JSON-lines files (default, no extra requirements).
+# "sqlite":  one indexed SQLite database (needs sqlite3 in the build).
+STORAGE_BACKEND = "journal"
+
+# Spam/threat messages live in an append-only journal (one JSON record per
+# line). The old whole-file JSON database is imported once on first start.
+DB_FILE = "spam_messages.jsonl"
+LEGACY_DB_FILE = "spam_messages.json"
+BLOCKED_SMS_FILE = "blocked_messages.jsonl"
+LEGACY_BLOCKED_SMS_FILE = "blocked_messages.json"
+INBOX_FILE = "sms_inbox.jsonl"
+SQLITE_DB_FILE = "soso_messages.db"
+
+
+# Appends are acknowledged in memory and committed by a background writer
+# in groups of up to WRITE_BATCH_SIZE records or every WRITE_DELAY seconds.
+WRITE_BATCH_SIZE = 50
+WRITE_DELAY = 1.0
+
+
+def _make_store(journal_path, table, legacy_path=None, on_commit=None):
+    if STORAGE_BACKEND == "sqlite" and sqlite3 is not None:
+        # Existing journals (or the old JSON files) are imported on first open.
+        legacy = journal_path if os.path.exists(journal_path) else legacy_path
+        store = SQLiteStore(SQLITE_DB_FILE, table, legacy_path=legacy)
+    else:
+        store = JournalStore(journal_path, legacy_path=legacy_path)
+    return WriteBehindStore(store, max_pending=WRITE_BATCH_SIZE, max_delay=WRITE_DELAY,
+                            on_commit=on_commit)
+
+
+def _spam_committed():
+    spam_counters.flush(force=True)
+    spam_dedup.flush()
+    spam_search.catch_up()
+
+
+def _blocked_committed():
+    blocked_counters.flush(force=True)
+
+
+spam_store = _make_store(DB_FILE, "spam", LEGACY_DB_FILE, on_commit=_spam_committed)
+blocked_store = _make_store(BLOCKED_SMS_FILE, "blocked", LEGACY_BLOCKED_SMS_FILE,
+                            on_commit=_blocked_committed)
+inbox_store = _make_store(INBOX_FILE, "inbox")
+
+# Running per-category totals, so the header never has to recount the archive.
+SPAM_COUNTERS_FILE = "spam_counters.json"
+BLOCKED_COUNTERS_FILE = "blocked_counters.json"
+
+spam_counters = CategoryCounters(SPAM_COUNTERS_FILE, spam_store)
+blocked_counters = CategoryCounters(BLOCKED_COUNTERS_FILE, blocked_store)
+
+# Content hashes of archived messages, so re-imports and repeated
+# deliveries of the same SMS are not stored twice.
+SPAM_INDEX_FILE = "spam_messages.idx"
+
+spam_dedup = DedupIndex(SPAM_INDEX_FILE, spam_store)
+_save_lock = threading.Lock()
+
+# Word / sender / date index of archived messages for the search box.
+SPAM_SEARCH_FILE = "spam_messages.search"
+
+
+def _sender_key(address):
+    return normalize_number(address) or (address or "").strip().lower()
+
+
+spam_search = SearchIndex(SPAM_SEARCH_FILE, spam_store, tokenize, address_key=_sender_key)
 
 
 def init_db():
-    try:
-        with open(DB_FILE, "r") as f:
-            json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        with open(DB_FILE, "w") as f:
-            json.dump({"messages": []}, f, indent=4)
+    spam_store.open()
+    blocked_store.open()
+    inbox_store.open()
+
+
+# ---------------- Rollover / Retention ----------------
+# The hot store is moved to a dated segment in ARCHIVE_DIR once it holds
+# ROLLOVER_MAX_RECORDS messages or is ROLLOVER_MAX_DAYS old. Segments older
+# than RETENTION_DAYS are deleted; their counts live on in the summary.
+ARCHIVE_DIR = "sms_archive"
+ROLLOVER_MAX_RECORDS = 5000
+ROLLOVER_MAX_DAYS = 30
+RETENTION_DAYS = 365
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+spam_archive = ArchiveSummary("spam_archive_summary.json")
+blocked_archive = ArchiveSummary("blocked_archive_summary.json")
+
+
+def _roll_over(name, store, counters, summary, indexes, now):
+    now_str = now.strftime(DATE_FORMAT)
+    since = summary.hot_since
+    if since is None:
+        summary.start_hot(now_str)
+        return
+
+    count = sum(counters.get().values())
+    too_old = since < (now - timedelta(days=ROLLOVER_MAX_DAYS)).strftime(DATE_FORMAT)
+    if not count:
+        if too_old:
+            summary.start_hot(now_str)
+        return
+    if count < ROLLOVER_MAX_RECORDS and not too_old:
+        return
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    segment = os.path.join(ARCHIVE_DIR, f"{name}-{now:%Y%m%d-%H%M%S}.jsonl")
+    with _save_lock:
+        counts, first, last = store.rollover(segment)
+        summary.add_segment(segment, counts, first, last, hot_since=now_str)
+        counters.reset()
+        for index in indexes:
+            index.rebuild()
+    print(f"Rolled {count} {name} messages over to {segment}")
+
+
+def maintain_archive(now=None):
+    """Roll over full/old hot stores and delete segments past retention."""
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=RETENTION_DAYS)).strftime(DATE_FORMAT)
+    for name, store, counters, summary, indexes in (
+            ("spam", spam_store, spam_counters, spam_archive, (spam_dedup, spam_search)),
+            ("blocked", blocked_store, blocked_counters, blocked_archive, ())):
+        try:
+            _roll_over(name, store, counters, summary, indexes, now)
+        except OSError as e:
+            print(f"Failed to roll over {name} messages:", e)
+        for path in summary.expire(cutoff):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def flush_all():
+    """
+    Commit everything still buffered in memory. Called when the app is
+    paused or stopped, since Android may kill it afterwards without notice.
+    """
+    for store in (spam_store, blocked_store, inbox_store):
+        try:
+            store.flush()
+        except OSError as e:
+            print("Failed to flush message store:", e)
+    spam_counters.flush(force=True)
+    blocked_counters.flush(force=True)
+    spam_dedup.flush()
+    sender_reputation.flush()
 
 
 def load_spam():
     """Load stored spam + threat messages."""
     try:
-        with open(DB_FILE, "r") as f:
-            return json.load(f).get("messages", [])
-    except:
+        return spam_store.load()
+    except OSError:
         return []
 
 
 def save_spam(messages):
-    """Append new spam messages to database."""
-    all_msgs = load_spam()
-    all_msgs.extend(messages)
+    """
+    Append new spam messages to database. Messages already stored (same
+    address, text and date) are skipped. Returns the messages actually added.
+    """
+    if not messages:
+        return []
+    with _save_lock:
+        stored = sum(spam_counters.get().values())
+        fresh, digests = spam_dedup.filter_new(messages, stored)
+        if fresh:
+            # Counters and index are saved when the writer commits the batch.
+            # Update them first: a commit in between then saves counts that are
+            # ahead of the store, which fails the marker check and rebuilds.
+            spam_counters.add(fresh, save=False)
+            spam_dedup.add(digests, save=False)
+            spam_store.append(fresh)
+    return fresh
 
-    with open(DB_FILE, "w") as f:
-        json.dump({"messages": all_msgs}, f, indent=4)
+
+def get_spam_counts():
+    """
+    Return all-time {"spam": n, "threat": m, "blocked": k} in constant time
+    (hot store counters plus the rolled-off segment summary).
+    """
+    counts = spam_counters.get()
+    for cat, n in spam_archive.totals().items():
+        counts[cat] = counts.get(cat, 0) + n
+    blocked = blocked_counters.get()
+    for cat, n in blocked_archive.totals().items():
+        blocked[cat] = blocked.get(cat, 0) + n
+    return {
+        "spam": counts.get("spam", 0),
+        "threat": counts.get("threat", 0),
+        "blocked": sum(blocked.values()),
+    }
 
 
 def get_grouped_spam():
     """Return dict for UI: all, spam count, threat count."""
-    all_msgs = load_spam()
-    spam = sum(1 for m in all_msgs if m["category"] == "spam")
-    threat = sum(1 for m in all_msgs if m["category"] == "threat")
+    data = get_spam_counts()
+    data["all"] = load_spam()
+    return data
+
+
+SPAM_PAGE_SIZE = 50
+
+
+def get_spam_page(offset=0, limit=SPAM_PAGE_SIZE):
+    """
+    Return one page of stored spam/threat messages, newest first, without
+    loading the rest of the store.
+    """
+    try:
+        return spam_store.page(offset, limit)
+    except OSError:
+        return []
+
+
+def get_spam_from(address):
+    """Stored spam/threat messages sent by one address."""
+    return spam_store.by_address(address)
+
+
+def get_spam_between(start, end):
+    """Stored spam/threat messages dated between two 'YYYY-MM-DD HH:MM:SS' strings."""
+    return spam_store.between(start, end)
+
+
+SEARCH_LIMIT = 200
+
+
+def parse_search_query(query):
+    """
+    Split a search box query into SearchIndex.search() arguments. Plain words
+    must all appear in the message; from:<number>, since:<date> and
+    until:<date> narrow it down, e.g. "prize from:09171234567 since:2024-05".
+    """
+    args = {"sender": None, "start": None, "end": None}
+    words = []
+    for part in (query or "").split():
+        field, sep, value = part.partition(":")
+        field = field.lower()
+        if sep and value and field == "from":
+            args["sender"] = value
+        elif sep and value and field == "since":
+            args["start"] = value
+        elif sep and value and field == "until":
+            args["end"] = value
+        else:
+            words.append(part)
+    args["text"] = " ".join(words)
+    return args
+
+
+def search_spam(query, limit=SEARCH_LIMIT):
+    """Stored spam/threat messages matching a search box query, newest first."""
+    try:
+        return spam_search.search(limit=limit, **parse_search_query(query))
+    except OSError as e:
+        print("Search failed:", e)
+        return []
+
 
-    return {"all": all_msgs, "spam": spam, "threat": threat}
+# ---------------- Inbox Snapshot ----------------
+def save_inbox_snapshot(messages, replace=True):
+    """Store the raw inbox rows read from the phone."""
+    if replace:
+        inbox_store.rewrite(messages)
+    else:
+        inbox_store.append(messages)
+
+
+def load_inbox_snapshot():
+    return inbox_store.load()
 
 
 # -------------------------------------------------------
 # SPAM / THREAT CLASSIFICATION RULES
 # -------------------------------------------------------
-SPAM_KEYWORDS = ["free", "win", "prize", "claim", "₱", "lottery"]
+SPAM_KEYWORDS = ["free", "freebie", "win", "prize", "claim", "₱", "lottery"]
 THREAT_KEYWORDS = ["kill", "hurt", "attack", "bomb", "shoot"]
 
+# Optional trained naive-Bayes weight table (see spam_scorer.save_weights).
+# The keyword lists above are always layered on top of it.
+WEIGHTS_FILE = "spam_weights.bin"
+
+# The user's keyword lists, and the compiled scorer (weight table + keywords)
+# they produced. The keywords file records a fingerprint of what the snapshot
+# was built from, so a stale snapshot is rebuilt instead of trusted.
+KEYWORDS_FILE = "spam_keywords.json"
+CLASSIFIER_FILE = "spam_classifier.bin"
+
+_base_scorer = None
+_scorer = None
+_scorer_lock = threading.Lock()
+_snapshot_id = None
+
+
+def _classifier_fingerprint():
+    try:
+        st = os.stat(WEIGHTS_FILE)
+        base = [st.st_size, st.st_mtime_ns]
+    except OSError:
+        base = None
+    data = json.dumps([SPAM_KEYWORDS, THREAT_KEYWORDS, base], ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def load_keywords():
+    """Replace the default keyword lists with the ones saved by the user, if any."""
+    global _snapshot_id
+    try:
+        with open(KEYWORDS_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    if isinstance(data.get("spam"), list):
+        SPAM_KEYWORDS[:] = data["spam"]
+    if isinstance(data.get("threat"), list):
+        THREAT_KEYWORDS[:] = data["threat"]
+    _snapshot_id = data.get("snapshot")
+
+
+def save_keywords(snapshot_id=None):
+    try:
+        write_json_atomic(KEYWORDS_FILE, {
+            "spam": SPAM_KEYWORDS,
+            "threat": THREAT_KEYWORDS,
+            "snapshot": snapshot_id,
+        })
+    except OSError as e:
+        print("Failed to save keywords:", e)
+
+
+def build_classifier(spam_keywords=None, threat_keywords=None):
+    """
+    Build the shared scorer: the weight table plus the current keyword lists.
+    Called again whenever the keyword lists change; the lists and the
+    compiled scorer are saved so the next launch can skip this.
+    """
+    global _base_scorer, _scorer, _snapshot_id
+    if spam_keywords is not None:
+        SPAM_KEYWORDS[:] = spam_keywords
+    if threat_keywords is not None:
+        THREAT_KEYWORDS[:] = threat_keywords
+
+    if _base_scorer is None:
+        _base_scorer = load_scorer(WEIGHTS_FILE)
+    scorer = _base_scorer.with_keywords(SPAM_KEYWORDS, THREAT_KEYWORDS)
+    with _scorer_lock:
+        _scorer = scorer
+
+    _snapshot_id = _classifier_fingerprint()
+    try:
+        scorer.save(CLASSIFIER_FILE)
+    except OSError as e:
+        print("Failed to save classifier snapshot:", e)
+        _snapshot_id = None
+    save_keywords(_snapshot_id)
+    return scorer
+
+
+def load_classifier():
+    """
+    Load the compiled scorer snapshot saved by build_classifier(), or build
+    it if it is missing or was made from other keywords / weights.
+    """
+    global _scorer
+    if _snapshot_id and _snapshot_id == _classifier_fingerprint():
+        try:
+            scorer = SpamScorer.from_file(CLASSIFIER_FILE)
+        except (OSError, ValueError) as e:
+            print("Failed to load classifier snapshot:", e)
+        else:
+            with _scorer_lock:
+                _scorer = scorer
+            return scorer
+    return build_classifier()
+
+
+def get_scorer():
+    with _scorer_lock:
+        scorer = _scorer
+    return scorer or load_classifier()
+
+
+def get_spam_keywords():
+    """The current spam keyword list (restored from KEYWORDS_FILE at import)."""
+    return list(SPAM_KEYWORDS)
+
+
+load_keywords()
+
+
+def score_message(message):
+    """Return {"spam": p, "threat": p} probabilities for one message."""
+    return get_scorer().score(message)
+
 
 def classify_message(message):
-    text = message.lower()
-    if any(word in text for word in THREAT_KEYWORDS):
-        return "threat"
-    elif any(word in text for word in SPAM_KEYWORDS):
-        return "spam"
-    return "normal"
+    return get_scorer().classify(message)
+
+
+def classify_batch(bodies):
+    """
+    Classify a whole page of message bodies at once.
+    Returns a list of categories in the same order as bodies.
+    """
+    return get_scorer().classify_batch(bodies)
 
 
-def filter_messages(messages):
-    """Filter inbox messages into spam/threat entries."""
+def filter_messages(messages, categories=None):
+    """
+    Filter inbox messages into spam/threat entries.
+    categories: optional precomputed classify_batch() result for messages.
+    """
+    if categories is None:
+        categories = classify_batch([msg["body"] for msg in messages])
+    now = None
     filtered = []
-    for msg in messages:
-        category = classify_message(msg["body"])
+    for msg, category in zip(messages, categories):
         if category != "normal":
+            date = msg.get("date")
+            if date is None:
+                now = now or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                date = now
             filtered.append({
                 "address": msg["address"],
                 "message": msg["body"],
-                "date": msg.get("date", datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+                "date": date,
                 "category": category
             })
     return filtered
 
 
+# -------------------------------------------------------
+# SENDER REPUTATION
+# -------------------------------------------------------
+# Senders with at least this many spam/threat messages, making up at least
+# KNOWN_SPAMMER_RATIO of what they sent, are known spammers: their messages
+# skip the spam scan and are only checked for threats.
+KNOWN_SPAMMER_MIN = 3
+KNOWN_SPAMMER_RATIO = 0.8
+REPUTATION_FILE = "sender_reputation.json"
+
+if STORAGE_BACKEND == "sqlite" and sqlite3 is not None:
+    sender_reputation = SenderReputation(SQLiteReputationBacking(SQLITE_DB_FILE))
+else:
+    sender_reputation = SenderReputation(JsonReputationBacking(REPUTATION_FILE))
+
+def is_known_contact(address):
+    """True if address belongs to a saved contact."""
+    return contacts_repo.has_number(address)
+
+
+def reputation_category(address):
+    """
+    Category implied by the sender alone, or None if there is none.
+    Saved contacts are trusted; blocked senders and known spammers are spam.
+    """
+    if not address:
+        return None
+    if is_known_contact(address):
+        return "normal"
+    rep = sender_reputation.get(address)
+    if rep is None:
+        return None
+    if rep.get("blocked"):
+        return "spam"
+    bad = rep.get("spam", 0) + rep.get("threat", 0)
+    if bad >= KNOWN_SPAMMER_MIN and bad >= KNOWN_SPAMMER_RATIO * (bad + rep.get("normal", 0)):
+        return "spam"
+    return None
+
+
+def classify_incoming(address, body):
+    """
+    Classify a received SMS, fast-pathing known senders: saved contacts are
+    not scanned, blocked senders and known spammers only get the threat
+    check, everyone else the full scan.
+    Reputation is not recorded here: scan_inbox records every inbox row
+    (live ones on the next launch) with its scanned category, so each SMS
+    counts once and fast-path labels never feed back into the table.
+    """
+    category = reputation_category(address)
+    if category == "normal":
+        return category
+    if category == "spam":
+        return "threat" if get_scorer().is_threat(body) else "spam"
+    return classify_message(body)
+
+
 # -------------------------------------------------------
 # READ SMS INBOX (ANDROID ONLY)
 # -------------------------------------------------------
-def read_sms_inbox():
-    """Returns SMS inbox messages. Works only on Android."""
+# High-water mark of the last inbox row already processed, so later
+# launches only query rows that arrived since.
+SCAN_STATE_FILE = "sms_scan_state.json"
+
+
+def load_scan_state():
+    """Return {"date": <ms>, "id": <_id>} of the newest scanned row, or None."""
+    try:
+        with open(SCAN_STATE_FILE, "r") as f:
+            state = json.load(f)
+        return {"date": int(state["date"]), "id": int(state["id"])}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_scan_state(messages):
+    """Advance the high-water mark past the given inbox rows."""
+    state = load_scan_state() or {"date": 0, "id": 0}
+    for msg in messages:
+        key = (msg.get("timestamp", 0), msg.get("id", 0))
+        if key > (state["date"], state["id"]):
+            state = {"date": key[0], "id": key[1]}
+    write_json_atomic(SCAN_STATE_FILE, state)
+
+
+INBOX_PROJECTION = ["_id", "address", "body", "date", "date_sent"]
+INBOX_PAGE_SIZE = 500
+
+
+def sms_date(sent_ms, fallback_ms=None):
+    """
+    Archive date of an SMS: the time the SMS centre stamped on it. The live
+    receiver (PDU timestamp) and the inbox scan (date_sent column) both see
+    that same value, so one SMS gets one dedup key whichever path saw it.
+    """
+    ms = sent_ms or fallback_ms
+    if not ms:
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return datetime.fromtimestamp(ms / 1000).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def iter_sms_inbox(since=None, page_size=INBOX_PAGE_SIZE):
+    """
+    Stream the SMS inbox as lists of at most page_size messages.
+    Only the needed columns are requested, so callers can classify one page
+    while the cursor is still being read. Works only on Android.
+    since: a scan state from load_scan_state(); only newer rows are read.
+    """
     if not IS_ANDROID:
-        print("read_sms_inbox() called on PC — returning empty list.")
-        return []
+        print("iter_sms_inbox() called on PC — no messages.")
+        return
 
     activity = PythonActivity.mActivity
     cr = activity.getContentResolver()
     Uri = autoclass('android.net.Uri')
     sms_uri = Uri.parse("content://sms/inbox")
 
-    cursor = cr.query(sms_uri, None, None, None, None)
-    messages = []
+    selection = None
+    selection_args = None
+    if since:
+        selection = "date > ? OR (date = ? AND _id > ?)"
+        selection_args = [str(since["date"]), str(since["date"]), str(since["id"])]
 
-    if cursor and cursor.moveToFirst():
-        while True:
-            address = cursor.getString(cursor.getColumnIndex("address"))
-            body = cursor.getString(cursor.getColumnIndex("body"))
-            timestamp = cursor.getLong(cursor.getColumnIndex("date"))
+    cursor = cr.query(sms_uri, INBOX_PROJECTION, selection, selection_args, "date ASC, _id ASC")
+    if not cursor:
+        return
 
-            date = datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        # Resolve column positions once instead of per row
+        id_col = cursor.getColumnIndex("_id")
+        address_col = cursor.getColumnIndex("address")
+        body_col = cursor.getColumnIndex("body")
+        date_col = cursor.getColumnIndex("date")
+        date_sent_col = cursor.getColumnIndex("date_sent")
 
-            messages.append({
-                "address": address,
-                "body": body,
-                "date": date,
+        page = []
+        while cursor.moveToNext():
+            timestamp = cursor.getLong(date_col)
+            page.append({
+                "id": cursor.getLong(id_col),
+                "address": cursor.getString(address_col),
+                "body": cursor.getString(body_col),
+                "date": sms_date(cursor.getLong(date_sent_col), timestamp),
+                "timestamp": timestamp,
             })
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+    finally:
+        cursor.close()
 
-            if not cursor.moveToNext():
-                break
 
-    if cursor:
-        cursor.close()
+def read_sms_inbox(since=None):
+    """
+    Returns SMS inbox messages as one list. Works only on Android.
+    Prefer iter_sms_inbox() for large inboxes.
+    """
+    if not IS_ANDROID:
+        print("read_sms_inbox() called on PC — returning empty list.")
+        return []
 
+    messages = []
+    for page in iter_sms_inbox(since=since):
+        messages.extend(page)
     return messages
 
+
+def scan_inbox(incremental=True, progress=None):
+    """
+    Read the inbox, archive spam/threat hits and advance the high-water mark.
+    With incremental=True only messages newer than the last scan are read.
+    Pages are processed as they stream in, so memory stays flat.
+    progress: optional callable(scanned, saved) invoked after every page.
+    Returns the number of new spam/threat messages saved.
+    """
+    since = load_scan_state() if incremental else None
+    if since is None:
+        save_inbox_snapshot([], replace=True)
+
+    scanned = 0
+    saved = 0
+    for page in iter_sms_inbox(since=since):
+        save_inbox_snapshot(page, replace=False)
+        categories = classify_batch([msg["body"] for msg in page])
+        sender_reputation.record(
+            (msg["address"], cat, msg["date"]) for msg, cat in zip(page, categories))
+        added = save_spam(filter_messages(page, categories))
+        # The hits must be on disk before the high-water mark moves past them
+        spam_store.flush()
+        save_scan_state(page)
+        scanned += len(page)
+        saved += len(added)
+        if progress:
+            progress(scanned, saved)
+    sender_reputation.flush()
+    return saved
+
+
 # -------------------------------------------------------
-# BLOCK SPAM FUNCTION
+# BACKGROUND INBOX IMPORT
+# -------------------------------------------------------
+class InboxImportWorker:
+    """
+    Runs archive maintenance and scan_inbox() on a background thread so the
+    UI can render right away.
+    on_progress(scanned, saved) and on_complete(saved, error) are always
+    called on the Kivy main thread via the Clock.
+    """
+
+    def __init__(self, on_progress=None, on_complete=None, incremental=True):
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.incremental = incremental
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="sms-import", daemon=True)
+        self._thread.start()
+
+    def _report_progress(self, scanned, saved):
+        if self.on_progress:
+            Clock.schedule_once(lambda dt: self.on_progress(scanned, saved))
+
+    def _run(self):
+        saved, error = 0, None
+        try:
+            maintain_archive()
+            saved = scan_inbox(incremental=self.incremental, progress=self._report_progress)
+        except Exception as e:
+            print("Inbox import failed:", e)
+            error = e
+        finally:
+            if IS_ANDROID:
+                # Threads that touched Java must detach before they exit
+                from jnius import detach
+                detach()
+        if self.on_complete:
+            Clock.schedule_once(lambda dt: self.on_complete(saved, error))
+
 # -------------------------------------------------------
-BLOCKED_SMS_FILE = "blocked_messages.json"
+# ARCHIVE RE-CLASSIFICATION
+# -------------------------------------------------------
+RECLASSIFY_CHUNK_SIZE = 500
+
+
+class ReclassifyJob:
+    """
+    Re-checks stored messages after the keyword lists change.
+
+    Only messages containing one of the changed (added or removed) keywords
+    are re-classified: archived ones may change category or drop out, and
+    inbox snapshot rows that were not archived may now qualify. Work is done
+    in chunks on a background thread and can be cancelled between chunks.
+    on_progress(checked) and on_complete(changed, cancelled) run on the
+    Kivy main thread.
+    """
+
+    def __init__(self, changed_keywords, on_progress=None, on_complete=None,
+                 chunk_size=RECLASSIFY_CHUNK_SIZE):
+        self.changed_keywords = set(changed_keywords)
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.chunk_size = chunk_size
+        self._cancel = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
 
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sms-reclassify", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def _chunks(self, records):
+        chunk = []
+        for r in records:
+            chunk.append(r)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _run(self):
+        changed = 0
+        try:
+            changed = self._reclassify()
+        except Exception as e:
+            print("Re-classification failed:", e)
+        if self.on_complete:
+            cancelled = self.cancelled
+            Clock.schedule_once(lambda dt: self.on_complete(changed, cancelled))
+
+    def _reclassify(self):
+        delta = KeywordMatcher(self.changed_keywords)
+        if not len(delta):
+            return 0
+
+        checked = 0
+        archived = set()
+        changes = {}
+
+        # 1) Archived messages that contain a changed keyword
+        for chunk in self._chunks(spam_store.iter_records()):
+            if self.cancelled:
+                return 0
+            hits = []
+            for r in chunk:
+                key = record_key(r)
+                archived.add(key)
+                if delta.search(r.get("message") or "") is not None:
+                    hits.append((key, r))
+            new_cats = classify_batch([r.get("message") for _, r in hits])
+            for (key, r), category in zip(hits, new_cats):
+                if category != r.get("category"):
+                    changes[key] = None if category == "normal" else category
+            checked += len(chunk)
+            self._report_progress(checked)
+
+        # 2) Inbox rows that were not archived but may match now
+        additions = []
+        for chunk in self._chunks(inbox_store.iter_records()):
+            if self.cancelled:
+                return 0
+            hits = [m for m in chunk
+                    if record_key(m) not in archived and delta.search(m.get("body") or "") is not None]
+            for entry in filter_messages(hits):
+                key = record_key(entry)
+                if key not in archived:
+                    archived.add(key)
+                    additions.append(entry)
+            checked += len(chunk)
+            self._report_progress(checked)
+
+        if self.cancelled:
+            return 0
+        if changes:
+            with _save_lock:
+                spam_store.apply_categories(changes)
+                spam_counters.reset()
+                spam_dedup.rebuild()
+                spam_search.rebuild()
+        return len(changes) + len(save_spam(additions))
+
+    def _report_progress(self, checked):
+        if self.on_progress:
+            Clock.schedule_once(lambda dt: self.on_progress(checked))
+
+
+_reclassify_job = None
+_pending_keywords = set()
+
+
+def update_spam_keywords(keywords, on_complete=None):
+    """
+    Replace the spam keyword list, rebuild the classifier and re-check the
+    stored archive against the keywords that were added or removed.
+    A job still running from an earlier edit is cancelled and its keywords
+    are folded into the new one.
+    """
+    global _reclassify_job, _pending_keywords
+    old = set(SPAM_KEYWORDS)
+    new = [kw.strip().lower() for kw in keywords if kw.strip()]
+    build_classifier(spam_keywords=new)
+
+    if _reclassify_job is not None and _reclassify_job.running:
+        _reclassify_job.cancel()
+    _pending_keywords |= old ^ set(new)
+    if not _pending_keywords:
+        return None
+
+    def finished(changed, cancelled):
+        global _pending_keywords
+        # A later edit may have started its own job with these keywords folded in
+        if not cancelled and _reclassify_job is job:
+            _pending_keywords = set()
+        if on_complete:
+            on_complete(changed, cancelled)
+
+    job = ReclassifyJob(_pending_keywords, on_complete=finished)
+    _reclassify_job = job
+    job.start()
+    return job
+
+
+# -------------------------------------------------------
+# BLOCK SPAM FUNCTION
+# -------------------------------------------------------
 def load_blocked_sms():
     """Load blocked messages (for local app storage)."""
     try:
-        with open(BLOCKED_SMS_FILE, "r") as f:
-            return json.load(f).get("messages", [])
-    except:
+        return blocked_store.load()
+    except OSError:
         return []
 
 def save_blocked_sms(messages):
     """Save blocked messages locally."""
-    all_msgs = load_blocked_sms()
-    all_msgs.extend(messages)
-    with open(BLOCKED_SMS_FILE, "w") as f:
-        json.dump({"messages": all_msgs}, f, indent=4)
+    if not messages:
+        return
+    blocked_counters.add(messages, save=False)  # before the append, as in save_spam
+    blocked_store.append(messages)
 
 def block_sms(message_dict):
     """
@@ -165,10 +903,245 @@ def block_sms(message_dict):
     message_dict should contain: address, message, date, category
     """
     save_blocked_sms([message_dict])
+    if message_dict.get("address"):
+        sender_reputation.mark_blocked(message_dict["address"])
+
+# -------------------------------------------------------
+# COALESCED UI REFRESH
+# -------------------------------------------------------
+REFRESH_WINDOW = 0.25  # seconds
+
+
+class RefreshScheduler:
+    """
+    Collapses bursts of new-message notifications into one UI refresh.
+    request() may be called from any thread; listeners run on the Kivy main
+    thread at most once per window with the combined delta:
+    {"spam": n, "threat": m, "messages": [...]}.
+    """
+
+    def __init__(self, window=REFRESH_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._pending = None
+
+    def bind(self, callback):
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def unbind(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def request(self, messages=()):
+        with self._lock:
+            first = self._pending is None
+            if first:
+                self._pending = {"spam": 0, "threat": 0, "messages": []}
+            for m in messages:
+                cat = m.get("category")
+                if cat in ("spam", "threat"):
+                    self._pending[cat] += 1
+                self._pending["messages"].append(m)
+        if first:
+            Clock.schedule_once(self._fire, self.window)
+
+    def _fire(self, dt):
+        with self._lock:
+            delta, self._pending = self._pending, None
+        if delta is None:
+            return
+        for callback in list(self._listeners):
+            callback(delta)
+
+
+ui_refresh = RefreshScheduler()
+
+
+# -------------------------------------------------------
+# THREAT ESCALATION
+# -------------------------------------------------------
+# Threat messages matching the user's severity rule skip the refresh window
+# above and raise the SOS countdown on the next frame.
+ESCALATION_FILE = "escalation_rule.json"
+ESCALATION_BUDGET = 0.1     # seconds from broadcast to countdown; slower runs are logged
+ESCALATION_COOLDOWN = 60.0  # at most one escalation per this many seconds
+
+DEFAULT_ESCALATION_RULE = {
+    "enabled": False,
+    "min_threat": 0.95,
+    "trigger_words": ["bomb", "kill", "shoot"],
+    "sos_category": "THREATS",
+}
+
+
+def _phrase(text):
+    # Tokens padded with spaces, so matching respects word boundaries
+    return " " + " ".join(tokenize(text)) + " "
+
+
+class EscalationRule:
+    """
+    Which threat messages warrant an SOS: any containing one of
+    trigger_words, or scoring at least min_threat on the threat scale.
+    sos_category is the contacts category the SOS goes to.
+    """
+
+    def __init__(self, enabled=False, min_threat=0.95, trigger_words=(), sos_category="THREATS"):
+        self.enabled = bool(enabled)
+        self.min_threat = float(min_threat)
+        self.trigger_words = [w.strip().lower() for w in trigger_words if w.strip()]
+        self.sos_category = sos_category
+        self._matcher = KeywordMatcher([_phrase(w) for w in self.trigger_words])
+
+    @classmethod
+    def load(cls, path=ESCALATION_FILE):
+        data = dict(DEFAULT_ESCALATION_RULE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return cls(**{key: data[key] for key in DEFAULT_ESCALATION_RULE})
+
+    def save(self, path=ESCALATION_FILE):
+        try:
+            write_json_atomic(path, self.to_dict())
+        except OSError as e:
+            print("Failed to save escalation rule:", e)
+
+    def to_dict(self):
+        return {
+            "enabled": self.enabled,
+            "min_threat": self.min_threat,
+            "trigger_words": self.trigger_words,
+            "sos_category": self.sos_category,
+        }
+
+    def matches(self, message):
+        """True if a classified message dict is severe enough to escalate."""
+        if not self.enabled or message.get("category") != "threat":
+            return False
+        body = message.get("message") or ""
+        if len(self._matcher) and self._matcher.search(_phrase(body)) is not None:
+            return True
+        return score_message(body)["threat"] >= self.min_threat
+
+
+class ThreatEscalator:
+    """
+    Escalation stage of the receive pipeline. offer() runs on the receiver
+    thread right after classification; for a matching message it runs the
+    prewarm hooks there (recipient lists, SMS API) and calls the listeners on
+    the next frame with an event dict:
+    {"message", "sos_category", "received", "matched", "prewarmed", "dispatched"}
+    (time.monotonic() stamps). Timings of the whole path are kept in `timings`.
+    """
+
+    def __init__(self, rule=None, budget=ESCALATION_BUDGET, cooldown=ESCALATION_COOLDOWN):
+        self.rule = rule or EscalationRule.load()
+        self.budget = budget
+        self.cooldown = cooldown
+        self.timings = deque(maxlen=50)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._prewarm = []
+        self._last = None
+
+    def bind(self, callback):
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def unbind(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def add_prewarm(self, hook):
+        """hook(sos_category) runs on the receiver thread before the UI is told."""
+        if hook not in self._prewarm:
+            self._prewarm.append(hook)
+
+    def set_rule(self, rule):
+        self.rule = rule
+        rule.save()
+
+    def offer(self, messages, received_at=None):
+        """Escalate the first message matching the rule. Returns it, or None."""
+        rule = self.rule
+        if not rule.enabled:
+            return None
+        hit = next((m for m in messages if rule.matches(m)), None)
+        if hit is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if self._last is not None and now - self._last < self.cooldown:
+                return None
+            self._last = now
+
+        event = {
+            "message": hit,
+            "sos_category": rule.sos_category,
+            "received": received_at or now,
+            "matched": now,
+        }
+        for hook in list(self._prewarm):
+            try:
+                hook(rule.sos_category)
+            except Exception as e:
+                print("SOS prewarm failed:", e)
+        event["prewarmed"] = time.monotonic()
+        Clock.schedule_once(lambda dt: self._dispatch(event))
+        return hit
+
+    def _dispatch(self, event):
+        event["dispatched"] = time.monotonic()
+        for callback in list(self._listeners):
+            callback(event)
+        done = time.monotonic()
+
+        start = event["received"]
+        timing = {step: round((event[step] - start) * 1000, 1)
+                  for step in ("matched", "prewarmed", "dispatched")}
+        timing["raised"] = round((done - start) * 1000, 1)
+        self.timings.append(timing)
+        if done - start > self.budget:
+            print("Threat escalation over budget (ms):", timing)
+
+    def latency_report(self):
+        """{"count", "avg_ms", "max_ms"} of broadcast -> countdown over recent escalations."""
+        raised = [t["raised"] for t in self.timings]
+        if not raised:
+            return {"count": 0, "avg_ms": None, "max_ms": None}
+        return {
+            "count": len(raised),
+            "avg_ms": round(sum(raised) / len(raised), 1),
+            "max_ms": max(raised),
+        }
+
+
+threat_escalator = ThreatEscalator()
+
 
 # -------------------------------------------------------
 # REAL-TIME SMS RECEIVER (ANDROID ONLY)
 # -------------------------------------------------------
+def assemble_pdus(parts):
+    """
+    Join the fragments of a multipart SMS.
+    parts: (address, body, timestamp_ms) per PDU, in delivery order.
+    Returns one (address, full_body, timestamp_ms of the first fragment)
+    per sender, in order of first fragment.
+    """
+    bodies = {}
+    stamps = {}
+    for address, body, timestamp in parts:
+        bodies.setdefault(address, []).append(body or "")
+        stamps.setdefault(address, timestamp)
+    return [(address, "".join(chunks), stamps[address]) for address, chunks in bodies.items()]
+
+
 class SMSReceiver(PythonJavaClass if IS_ANDROID else object):
     if IS_ANDROID:
         __javainterfaces__ = ['android/content/BroadcastReceiver']
@@ -178,32 +1151,47 @@ class SMSReceiver(PythonJavaClass if IS_ANDROID else object):
         if IS_ANDROID:
             super().__init__()
         self.update_callback = update_callback
+        if update_callback:
+            ui_refresh.bind(update_callback)
 
     # Only implemented on Android
     if IS_ANDROID:
         @java_method('(Landroid/content/Context;Landroid/content/Intent;)V')
         def onReceive(self, context, intent):
+            received_at = time.monotonic()
             extras = intent.getExtras()
             if extras and extras.containsKey("pdus"):
                 pdus = extras.get("pdus")
-                new_msgs = []
+                pdu_format = extras.getString("format")
 
+                parts = []
                 for pdu in pdus:
-                    sms = SmsMessage.createFromPdu(pdu)
-                    body = sms.getMessageBody()
-                    sender = sms.getOriginatingAddress()
+                    if pdu_format:
+                        sms = SmsMessage.createFromPdu(pdu, pdu_format)
+                    else:
+                        sms = SmsMessage.createFromPdu(pdu)
+                    parts.append((sms.getOriginatingAddress(), sms.getMessageBody(),
+                                  sms.getTimestampMillis()))
 
-                    category = classify_message(body)
+                # A long SMS arrives as several PDUs in one broadcast:
+                # classify, store and announce each whole message once.
+                new_msgs = []
+                for sender, body, timestamp in assemble_pdus(parts):
+                    date = sms_date(timestamp)
+                    category = classify_incoming(sender, body)
 
                     if category != "normal":
                         new_msgs.append({
                             "address": sender,
                             "message": body,
-                            "date": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                            "date": date,
                             "category": category
                         })
-                    
-                if new_msgs:
-                    save_spam(new_msgs)
-                    if self.update_callback:
-                        Clock.schedule_once(lambda dt: self.update_callback())
+
+                # Severe threats go straight to the SOS countdown
+                threat_escalator.offer(new_msgs, received_at)
+
+                added = save_spam(new_msgs)
+                if added:
+                    # Listeners (update_callback included) get one call per burst
+                    ui_refresh.request(added)
@@ -0,0 +1,1263 @@
+# sms_store.py
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def load_legacy_file(path):
+    """Read records from an old {"messages": [...]} file or a JSON-lines journal."""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict) and "messages" in data:
+            return data["messages"]
+    except ValueError:
+        pass
+    records = []
+    for line in text.splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def record_key(record):
+    """Identity of a stored message: (address, text, date)."""
+    return (record.get("address"), record.get("message", record.get("body")), record.get("date"))
+
+
+DIGEST_LENGTH = 16
+
+
+def record_digest(record):
+    """Short content hash of a message's (address, text, date)."""
+    raw = json.dumps(record_key(record), ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:DIGEST_LENGTH]
+
+
+def summarize_records(records):
+    """Return (category counts, first date, last date) for some records."""
+    counts = {}
+    first = last = None
+    for r in records:
+        cat = r.get("category")
+        counts[cat] = counts.get(cat, 0) + 1
+        date = r.get("date")
+        if date:
+            first = date if first is None or date < first else first
+            last = date if last is None or date > last else last
+    return counts, first, last
+
+
+def write_json_atomic(path, data):
+    """Write a small JSON file via a temp file + rename so it is never half-written."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# -------------------------------------------------------
+# APPEND-ONLY JOURNAL STORE
+# -------------------------------------------------------
+class JournalStore:
+    """
+    Append-only message store: one JSON record per line.
+
+    Appends never touch existing data, so saving a message costs the same
+    no matter how large the archive is. Writes are flushed to the OS right
+    away but only fsync'ed every `sync_every` records (or `sync_interval`
+    seconds), and the file is compacted when too many broken lines pile up.
+    """
+
+    def __init__(self, path, legacy_path=None, sync_every=20, sync_interval=2.0,
+                 compact_threshold=50):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_threshold = compact_threshold
+
+        self._lock = threading.RLock()
+        self._handle = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._bad_lines = 0
+        # Byte offset of every complete line, for paged reads. Extended
+        # lazily past _indexed_to and reset whenever the file is replaced.
+        self._offsets = []
+        self._indexed_to = 0
+
+    # ---------------- Setup ----------------
+    def open(self):
+        """Create the journal (importing the legacy JSON file once if present)."""
+        with self._lock:
+            if not os.path.exists(self.path):
+                self._rewrite(self._load_legacy())
+            if self._handle is None:
+                torn = self._ends_mid_line()
+                self._handle = open(self.path, "a", encoding="utf-8")
+                if torn:
+                    # Terminate a line cut off by a crash so it can't swallow
+                    # the next record; the broken line is dropped on compaction.
+                    self._handle.write("\n")
+
+    def _ends_mid_line(self):
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def _load_legacy(self):
+        return load_legacy_file(self.legacy_path)
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self.sync()
+                self._handle.close()
+                self._handle = None
+
+    # ---------------- Read ----------------
+    def iter_records(self):
+        """Yield stored records in insertion order, skipping torn lines."""
+        # Snapshot the file end under the lock, then read without holding it
+        # so a slow reader never blocks the SMS receiver from appending.
+        with self._lock:
+            if self._handle is not None:
+                self._handle.flush()
+            if not os.path.exists(self.path):
+                return
+            f = open(self.path, "rb")
+            end = os.fstat(f.fileno()).st_size
+
+        bad = 0
+        pos = 0
+        with f:
+            for line in f:
+                pos += len(line)
+                if pos > end:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line.decode("utf-8"))
+                except ValueError:
+                    bad += 1
+        self._bad_lines = bad
+
+    def load(self):
+        records = list(self.iter_records())
+        if self._bad_lines >= self.compact_threshold:
+            self.compact()
+        return records
+
+    # ---------------- Paging ----------------
+    def _index_lines(self):
+        """Extend the line-offset index over lines appended since last time."""
+        with self._lock:
+            if self._handle is not None:
+                self._handle.flush()
+            if not os.path.exists(self.path):
+                return self._offsets
+            with open(self.path, "rb") as f:
+                f.seek(self._indexed_to)
+                pos = self._indexed_to
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # still being written
+                    if line.strip():
+                        self._offsets.append(pos)
+                    pos += len(line)
+            self._indexed_to = pos
+            return self._offsets
+
+    def count(self):
+        """Number of stored lines (torn lines included until compaction)."""
+        with self._lock:
+            return len(self._index_lines())
+
+    def page(self, offset, limit, newest_first=True):
+        """
+        Return up to `limit` records, skipping the first `offset` counted from
+        the newest end (or the oldest, with newest_first=False). Only the
+        requested lines are read from disk.
+        """
+        with self._lock:
+            offsets = self._index_lines()
+            if newest_first:
+                stop = max(len(offsets) - offset, 0)
+                wanted = offsets[max(stop - limit, 0):stop][::-1]
+            else:
+                wanted = offsets[offset:offset + limit]
+            if not wanted:
+                return []
+            f = open(self.path, "rb")
+        return [r for r in self._read_lines(f, wanted) if r is not None]
+
+    def since(self, position):
+        """
+        Return ([(position, record), ...], next_position) for the records
+        stored at or after `position` (a line number). Positions stay valid
+        until the journal is rewritten.
+        """
+        with self._lock:
+            offsets = self._index_lines()
+            end = len(offsets)
+            wanted = offsets[position:]
+            if not wanted:
+                return [], end
+            f = open(self.path, "rb")
+        records = self._read_lines(f, wanted)
+        return [(pos, r) for pos, r in enumerate(records, position) if r is not None], end
+
+    def get(self, positions):
+        """Records at the given positions (from since()), in that order."""
+        with self._lock:
+            offsets = self._index_lines()
+            wanted = [offsets[p] for p in positions if 0 <= p < len(offsets)]
+            if not wanted:
+                return []
+            f = open(self.path, "rb")
+        return [r for r in self._read_lines(f, wanted) if r is not None]
+
+    @staticmethod
+    def _read_lines(f, offsets):
+        """Parse the line at each offset (None for a broken one) and close f."""
+        records = []
+        with f:
+            for pos in offsets:
+                f.seek(pos)
+                try:
+                    records.append(json.loads(f.readline().decode("utf-8")))
+                except ValueError:
+                    records.append(None)
+        return records
+
+    # ---------------- Write ----------------
+    def append(self, records):
+        """Append records to the end of the journal. O(len(records))."""
+        if not records:
+            return
+        with self._lock:
+            self.open()
+            lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+            self._handle.write(lines)
+            self._handle.flush()
+            self._unsynced += len(records)
+            if (self._unsynced >= self.sync_every or
+                    time.monotonic() - self._last_sync >= self.sync_interval):
+                self.sync()
+
+    def sync(self):
+        """Force buffered appends down to storage."""
+        with self._lock:
+            if self._handle is not None and self._unsynced:
+                self._handle.flush()
+                os.fsync(self._handle.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def compact(self):
+        """Rewrite the journal without torn/corrupt lines."""
+        with self._lock:
+            self.rewrite(list(self.iter_records()))
+
+    def rewrite(self, records):
+        """Atomically replace the whole journal with `records`."""
+        with self._lock:
+            reopen = self._handle is not None
+            if reopen:
+                self._handle.close()
+                self._handle = None
+            self._rewrite(records)
+            self._bad_lines = 0
+            if reopen:
+                self._handle = open(self.path, "a", encoding="utf-8")
+
+    def apply_categories(self, changes):
+        """
+        Re-label stored records in place.
+        changes maps record_key(r) -> new category, or None to drop the record.
+        """
+        if not changes:
+            return
+        with self._lock:
+            updated = []
+            for r in self.iter_records():
+                key = record_key(r)
+                if key in changes:
+                    if changes[key] is None:
+                        continue
+                    r["category"] = changes[key]
+                updated.append(r)
+            self.rewrite(updated)
+
+    def rollover(self, segment_path):
+        """
+        Move the whole journal to segment_path and start an empty one.
+        Returns (category counts, first date, last date) of the moved records.
+        """
+        with self._lock:
+            summary = summarize_records(self.iter_records())
+            reopen = self._handle is not None
+            if reopen:
+                self.sync()
+                self._handle.close()
+                self._handle = None
+            os.replace(self.path, segment_path)
+            self._rewrite([])
+            self._bad_lines = 0
+            if reopen:
+                self._handle = open(self.path, "a", encoding="utf-8")
+            return summary
+
+    def _rewrite(self, records):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._offsets = []
+        self._indexed_to = 0
+
+    # ---------------- Queries ----------------
+    # The journal has no indexes, so these are plain scans; SQLiteStore
+    # answers the same calls from its indexes.
+    def count_by_category(self):
+        counts = {}
+        for r in self.iter_records():
+            cat = r.get("category")
+            counts[cat] = counts.get(cat, 0) + 1
+        return counts
+
+    def by_address(self, address):
+        return [r for r in self.iter_records() if r.get("address") == address]
+
+    def marker(self):
+        """Cheap fingerprint of the stored data (changes on every write)."""
+        with self._lock:
+            if self._handle is not None:
+                self._handle.flush()
+            try:
+                return os.path.getsize(self.path)
+            except OSError:
+                return 0
+
+    def between(self, start, end):
+        """Records whose date string falls in [start, end]."""
+        return [r for r in self.iter_records() if start <= r.get("date", "") <= end]
+
+
+# -------------------------------------------------------
+# SQLITE STORE (OPTIONAL)
+# -------------------------------------------------------
+# sqlite3 needs the `sqlite3` recipe in buildozer requirements on Android,
+# so the backend is optional and the journal stays the default.
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def sqlite_connection(path):
+    """
+    Return (connection, lock) for a database file. Tables in the same file
+    share one connection, and its lock keeps their transactions apart.
+    """
+    if sqlite3 is None:
+        raise RuntimeError("sqlite3 is not available on this build")
+    with _connections_lock:
+        entry = _connections.get(path)
+        if entry is None:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            entry = _connections[path] = (conn, threading.RLock())
+        return entry
+
+
+class SQLiteStore:
+    """
+    Message store backed by one SQLite table, indexed on category,
+    address and date. Same interface as JournalStore.
+    """
+
+    def __init__(self, path, table, legacy_path=None):
+        self.path = path
+        self.table = table
+        self.legacy_path = legacy_path
+        self._conn, self._lock = sqlite_connection(path)
+        self._db = None
+
+    # ---------------- Setup ----------------
+    def open(self):
+        with self._lock:
+            if self._db is not None:
+                return
+            db = self._conn
+            t = self.table
+            exists = db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (t,)
+            ).fetchone()
+            db.execute(f"""CREATE TABLE IF NOT EXISTS {t} (
+                id INTEGER PRIMARY KEY,
+                address TEXT,
+                message TEXT,
+                date TEXT,
+                category TEXT,
+                data TEXT NOT NULL)""")
+            db.execute(f"CREATE INDEX IF NOT EXISTS {t}_category ON {t}(category)")
+            db.execute(f"CREATE INDEX IF NOT EXISTS {t}_address ON {t}(address)")
+            db.execute(f"CREATE INDEX IF NOT EXISTS {t}_date ON {t}(date)")
+            db.commit()
+            self._db = db
+            if not exists and self.legacy_path:
+                self.append(load_legacy_file(self.legacy_path))
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db = None
+
+    # ---------------- Read ----------------
+    def _query(self, where="", params=()):
+        self.open()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT data FROM {self.table} {where} ORDER BY id", params
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def iter_records(self):
+        return iter(self._query())
+
+    def load(self):
+        return self._query()
+
+    def count(self):
+        self.open()
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def page(self, offset, limit, newest_first=True):
+        order = "DESC" if newest_first else "ASC"
+        self.open()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT data FROM {self.table} ORDER BY id {order} LIMIT ? OFFSET ?",
+                (limit, offset)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def since(self, position):
+        """Same as JournalStore.since(); positions are row ids."""
+        self.open()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, data FROM {self.table} WHERE id >= ? ORDER BY id",
+                (position,)).fetchall()
+            end = self._db.execute(
+                f"SELECT COALESCE(MAX(id), 0) + 1 FROM {self.table}").fetchone()[0]
+        return [(row_id, json.loads(data)) for row_id, data in rows], end
+
+    def get(self, positions):
+        self.open()
+        found = {}
+        with self._lock:
+            for i in range(0, len(positions), 500):
+                chunk = list(positions[i:i + 500])
+                marks = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT id, data FROM {self.table} WHERE id IN ({marks})", chunk)
+                for row_id, data in rows:
+                    found[row_id] = json.loads(data)
+        return [found[p] for p in positions if p in found]
+
+    # ---------------- Write ----------------
+    @staticmethod
+    def _row(r):
+        return (r.get("address"), r.get("message", r.get("body")), r.get("date"),
+                r.get("category"), json.dumps(r, ensure_ascii=False))
+
+    def append(self, records):
+        if not records:
+            return
+        self.open()
+        with self._lock:
+            self._db.executemany(
+                f"INSERT INTO {self.table} (address, message, date, category, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [self._row(r) for r in records])
+            self._db.commit()
+
+    def sync(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+
+    def compact(self):
+        self.open()
+        with self._lock:
+            self._db.execute("VACUUM")
+
+    def rewrite(self, records):
+        self.open()
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table}")
+            self._db.executemany(
+                f"INSERT INTO {self.table} (address, message, date, category, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [self._row(r) for r in records])
+            self._db.commit()
+
+    def apply_categories(self, changes):
+        if not changes:
+            return
+        self.open()
+        with self._lock:
+            for (address, message, date), category in changes.items():
+                rows = self._db.execute(
+                    f"SELECT id, data FROM {self.table} "
+                    "WHERE address IS ? AND message IS ? AND date IS ?",
+                    (address, message, date)).fetchall()
+                for row_id, data in rows:
+                    if category is None:
+                        self._db.execute(f"DELETE FROM {self.table} WHERE id = ?", (row_id,))
+                        continue
+                    r = json.loads(data)
+                    r["category"] = category
+                    self._db.execute(
+                        f"UPDATE {self.table} SET category = ?, data = ? WHERE id = ?",
+                        (category, json.dumps(r, ensure_ascii=False), row_id))
+            self._db.commit()
+
+    def rollover(self, segment_path):
+        """Export every row to a JSON-lines segment file and empty the table."""
+        self.open()
+        with self._lock:
+            records = self._query()
+            tmp_path = segment_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for r in records:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, segment_path)
+            self._db.execute(f"DELETE FROM {self.table}")
+            self._db.commit()
+        return summarize_records(records)
+
+    # ---------------- Queries ----------------
+    def count_by_category(self):
+        self.open()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT category, COUNT(*) FROM {self.table} GROUP BY category"
+            ).fetchall()
+        return dict(rows)
+
+    def by_address(self, address):
+        return self._query("WHERE address = ?", (address,))
+
+    def marker(self):
+        self.open()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM {self.table}"
+            ).fetchone()
+        return list(row)
+
+    def between(self, start, end):
+        return self._query("WHERE date BETWEEN ? AND ?", (start, end))
+
+
+# -------------------------------------------------------
+# WRITE-BEHIND BUFFER
+# -------------------------------------------------------
+class WriteBehindStore:
+    """
+    Wraps a JournalStore/SQLiteStore so append() returns as soon as the
+    records are queued in memory. A background writer commits the queue in
+    groups (one append + one sync per group) once `max_pending` records are
+    waiting or the oldest has waited `max_delay` seconds. Reads and rewrites
+    flush the queue first, so callers always see their own writes.
+    on_commit() runs on the writer after every group commit. A group that
+    fails to append goes back to the front of the queue for the next try.
+    """
+
+    def __init__(self, store, max_pending=50, max_delay=1.0, on_commit=None):
+        self.store = store
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.on_commit = on_commit
+        self._cond = threading.Condition()
+        self._pending = []
+        self._oldest = None
+        self._commit_lock = threading.RLock()
+        self._thread = None
+        self._stopping = False
+
+    def __getattr__(self, name):
+        # Anything not wrapped here (e.g. queries added later) sees flushed data
+        attr = getattr(self.store, name)
+        if callable(attr):
+            def flushed(*args, **kwargs):
+                self.flush()
+                return attr(*args, **kwargs)
+            return flushed
+        return attr
+
+    # ---------------- Setup ----------------
+    def open(self):
+        self.store.open()
+        with self._cond:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(
+                    target=self._writer, name="sms-write-behind", daemon=True)
+                self._thread.start()
+
+    def close(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self.store.close()
+
+    # ---------------- Write ----------------
+    def append(self, records):
+        if not records:
+            return
+        if self._thread is None:
+            self.open()
+        with self._cond:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.extend(records)
+            if len(self._pending) >= self.max_pending:
+                self._cond.notify()
+
+    def flush(self):
+        """Commit everything queued so far (blocks until it is on disk)."""
+        with self._commit_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if batch:
+                try:
+                    self.store.append(batch)
+                except Exception:
+                    with self._cond:
+                        if not self._pending:
+                            self._oldest = time.monotonic()
+                        self._pending[:0] = batch
+                    raise
+            self.store.sync()
+            if batch and self.on_commit:
+                self.on_commit()
+
+    sync = flush
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if len(self._pending) >= self.max_pending:
+                        break
+                    if self._pending:
+                        wait = self._oldest + self.max_delay - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception as e:  # OSError, sqlite3 "database is locked", ...
+                print("Write-behind flush failed:", e)
+                time.sleep(self.max_delay)
+
+    # ---------------- Read / Rewrite ----------------
+    def iter_records(self):
+        self.flush()
+        return self.store.iter_records()
+
+    def load(self):
+        self.flush()
+        return self.store.load()
+
+    def rewrite(self, records):
+        with self._commit_lock:
+            with self._cond:
+                self._pending = []
+            self.store.rewrite(records)
+
+    def apply_categories(self, changes):
+        self.flush()
+        self.store.apply_categories(changes)
+
+    def rollover(self, segment_path):
+        with self._commit_lock:
+            self.flush()
+            return self.store.rollover(segment_path)
+
+
+# -------------------------------------------------------
+# RUNNING CATEGORY COUNTERS
+# -------------------------------------------------------
+class CategoryCounters:
+    """
+    Per-category message counts kept next to a store, so reading them is
+    constant-time. The saved file remembers the store's marker(); if the two
+    disagree (crash between writes, file edited by hand) the counts are
+    rebuilt once from the store.
+    """
+
+    def __init__(self, path, store):
+        self.path = path
+        self.store = store
+        self._lock = threading.Lock()
+        self._counts = None
+        self._dirty = False
+
+    # The store is never called while holding self._lock: a write-behind
+    # store may be committing on another thread and call flush() on us.
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("marker") == self.store.marker():
+                return data.get("counts", {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return self.rebuild_counts()
+
+    def rebuild_counts(self):
+        counts = self.store.count_by_category()
+        self._save(counts, self.store.marker())
+        return counts
+
+    def _save(self, counts, marker):
+        try:
+            write_json_atomic(self.path, {"marker": marker, "counts": counts})
+        except OSError as e:
+            print("Failed to save counters:", e)
+
+    def get(self):
+        with self._lock:
+            if self._counts is not None:
+                return dict(self._counts)
+        counts = self._load()
+        with self._lock:
+            if self._counts is None:
+                self._counts = counts
+            return dict(self._counts)
+
+    def add(self, records, save=True):
+        """
+        Count records that were just appended to the store.
+        With save=False the file is only written on the next flush().
+        """
+        self.get()
+        with self._lock:
+            for r in records:
+                cat = r.get("category")
+                self._counts[cat] = self._counts.get(cat, 0) + 1
+            self._dirty = True
+        if save:
+            self.flush()
+
+    def flush(self, force=False):
+        """Save the counts if they changed (or always, with force=True)."""
+        with self._lock:
+            if not (self._dirty or force) or self._counts is None:
+                return
+            counts = dict(self._counts)
+            self._dirty = False
+        self._save(counts, self.store.marker())
+
+    def reset(self):
+        """Recount from the store (after a rewrite)."""
+        counts = self.rebuild_counts()
+        with self._lock:
+            self._counts = counts
+            self._dirty = False
+
+
+# -------------------------------------------------------
+# DEDUPLICATION INDEX
+# -------------------------------------------------------
+class DedupIndex:
+    """
+    Set of content hashes of every record in a store, so an insert can be
+    checked for duplicates in O(1). The hashes are kept in an append-only
+    file of fixed-width lines; when its line count no longer matches the
+    store's record count the index is rebuilt from the store once.
+    """
+
+    def __init__(self, path, store):
+        self.path = path
+        self.store = store
+        self._lock = threading.Lock()
+        self._digests = None
+        self._unsaved = []
+
+    # As with CategoryCounters, the store is only called without self._lock.
+    def _read(self, expected_count):
+        line = DIGEST_LENGTH + 1
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = -1
+        if size >= 0 and size % line == 0 and size // line == expected_count:
+            with open(self.path, "r", encoding="ascii") as f:
+                return set(f.read().split())
+        return self._rebuild()
+
+    def _rebuild(self):
+        digests = [record_digest(r) for r in self.store.iter_records()]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="ascii") as f:
+            f.write("".join(d + "\n" for d in digests))
+        os.replace(tmp_path, self.path)
+        return set(digests)
+
+    def rebuild(self):
+        """Re-hash the whole store (after records were dropped or rewritten)."""
+        digests = self._rebuild()
+        with self._lock:
+            self._digests = digests
+            self._unsaved = []
+
+    def filter_new(self, records, expected_count):
+        """
+        Return (records not stored yet, their digests), also dropping
+        duplicates inside `records`. expected_count is the store's current
+        record count, used to validate the saved index.
+        """
+        if self._digests is None:
+            digests = self._read(expected_count)
+            with self._lock:
+                if self._digests is None:
+                    self._digests = digests
+        with self._lock:
+            fresh, digests = [], []
+            batch = set()
+            for r in records:
+                d = record_digest(r)
+                if d in self._digests or d in batch:
+                    continue
+                batch.add(d)
+                fresh.append(r)
+                digests.append(d)
+            return fresh, digests
+
+    def add(self, digests, save=True):
+        """
+        Record digests of records that were just appended to the store.
+        With save=False they are only written on the next flush().
+        """
+        if not digests:
+            return
+        with self._lock:
+            self._digests.update(digests)
+            self._unsaved.extend(digests)
+        if save:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, []
+            if unsaved:
+                with open(self.path, "a", encoding="ascii") as f:
+                    f.write("".join(d + "\n" for d in unsaved))
+
+
+# -------------------------------------------------------
+# FULL-TEXT SEARCH INDEX
+# -------------------------------------------------------
+class SearchIndex:
+    """
+    Inverted index over a store: token -> positions of the records that
+    contain it, the same per sender, and a date-sorted list for range
+    queries. Positions come from store.since() and are turned back into
+    records with store.get(), so a search only reads the matching lines.
+
+    The index is kept as an append-only log of one line per record
+    ("position, date, sender, tokens") and catches up with whatever the
+    store gained since the last call. Call rebuild() after the store is
+    rewritten or rolled over, since positions change then.
+    """
+
+    def __init__(self, path, store, tokenize, address_key=None):
+        self.path = path
+        self.store = store
+        self.tokenize = tokenize
+        self.address_key = address_key or (lambda a: (a or "").strip().lower())
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self._next = 0
+        self._postings = {}
+        self._senders = {}
+        self._dates = []  # (date, position), sorted lazily before a range query
+        self._dates_sorted = True
+
+    # As with CategoryCounters, the store is only called without self._lock.
+    def _entry(self, pos, record):
+        text = record.get("message", record.get("body")) or ""
+        tokens = sorted(set(self.tokenize(text)))
+        sender = self.address_key(record.get("address"))
+        date = record.get("date") or ""
+        return pos, _log_field(date), _log_field(sender), tokens
+
+    def _add(self, pos, date, sender, tokens):
+        for tok in tokens:
+            self._postings.setdefault(tok, []).append(pos)
+        if sender:
+            self._senders.setdefault(sender, []).append(pos)
+        self._dates.append((date, pos))
+        self._dates_sorted = False
+        self._next = max(self._next, pos + 1)
+
+    @staticmethod
+    def _log_line(pos, date, sender, tokens):
+        return f"{pos}\t{date}\t{sender}\t{' '.join(tokens)}\n"
+
+    def _read_log(self):
+        self._reset()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4 or not line.endswith("\n"):
+                        continue
+                    try:
+                        pos = int(parts[0])
+                    except ValueError:
+                        continue
+                    self._add(pos, parts[1], parts[2], parts[3].split())
+        except OSError:
+            pass
+        self._loaded = True
+
+    def catch_up(self):
+        """Index the records appended to the store since the last call."""
+        with self._lock:
+            if not self._loaded:
+                self._read_log()
+            start = self._next
+        entries, end = self.store.since(start)
+
+        with self._lock:
+            if end < self._next:
+                stale = True  # the store shrank underneath the index
+            else:
+                stale = False
+                lines = []
+                for pos, r in entries:
+                    if pos < self._next:
+                        continue  # indexed by a concurrent catch_up()
+                    entry = self._entry(pos, r)
+                    self._add(*entry)
+                    lines.append(self._log_line(*entry))
+                if lines:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write("".join(lines))
+                self._next = max(self._next, end)
+        if stale:
+            self.rebuild()
+
+    def rebuild(self):
+        """Re-index the whole store."""
+        entries, end = self.store.since(0)
+        entries = [self._entry(pos, r) for pos, r in entries]
+        with self._lock:
+            self._reset()
+            for entry in entries:
+                self._add(*entry)
+            self._next = end
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("".join(self._log_line(*entry) for entry in entries))
+            os.replace(tmp_path, self.path)
+            self._loaded = True
+
+    # ---------------- Query ----------------
+    def search(self, text="", sender=None, start=None, end=None, limit=200):
+        """
+        Records containing every word of `text`, from `sender`, dated within
+        [start, end], newest first. Each filter is optional; `end` may be a
+        prefix such as "2024-05-31" to include that whole day.
+        """
+        self.catch_up()
+        with self._lock:
+            candidates = [self._postings.get(tok, ()) for tok in set(self.tokenize(text))]
+            if sender:
+                candidates.append(self._senders.get(self.address_key(sender), ()))
+            if start or end:
+                if not self._dates_sorted:
+                    self._dates.sort()
+                    self._dates_sorted = True
+                lo = bisect.bisect_left(self._dates, (start or "",))
+                hi = len(self._dates)
+                if end:
+                    hi = bisect.bisect_right(self._dates, (end + "\uffff",))
+                candidates.append([pos for _, pos in self._dates[lo:hi]])
+            if not candidates:
+                return []
+            candidates.sort(key=len)
+            hits = set(candidates[0])
+            for positions in candidates[1:]:
+                if not hits:
+                    break
+                hits.intersection_update(positions)
+            positions = sorted(hits, reverse=True)[:limit]
+        return self.store.get(positions)
+
+
+def _log_field(value):
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+
+# -------------------------------------------------------
+# ARCHIVE SEGMENTS
+# -------------------------------------------------------
+class ArchiveSummary:
+    """
+    Bookkeeping for segments rolled off a store: per-segment category
+    counts and date range, plus folded totals of segments that were deleted
+    by retention. Lets the app report all-time counts without ever loading
+    the segments themselves.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+            self._data.setdefault("segments", {})
+            self._data.setdefault("expired", {})
+            self._data.setdefault("hot_since", None)
+        return self._data
+
+    def _save(self):
+        write_json_atomic(self.path, self._data)
+
+    @property
+    def hot_since(self):
+        """When the current (hot) store was started."""
+        with self._lock:
+            return self._load()["hot_since"]
+
+    def start_hot(self, when):
+        with self._lock:
+            self._load()["hot_since"] = when
+            self._save()
+
+    def add_segment(self, segment_path, counts, first, last, hot_since):
+        with self._lock:
+            data = self._load()
+            data["segments"][segment_path] = {"counts": counts, "first": first, "last": last}
+            data["hot_since"] = hot_since
+            self._save()
+
+    def segments(self):
+        with self._lock:
+            return sorted(self._load()["segments"])
+
+    def expire(self, cutoff):
+        """
+        Forget segments whose newest record is older than cutoff, folding
+        their counts into the expired totals. Returns their paths.
+        """
+        with self._lock:
+            data = self._load()
+            gone = [path for path, seg in data["segments"].items()
+                    if (seg.get("last") or "") < cutoff]
+            for path in gone:
+                for cat, n in data["segments"].pop(path)["counts"].items():
+                    data["expired"][cat] = data["expired"].get(cat, 0) + n
+            if gone:
+                self._save()
+            return gone
+
+    def totals(self):
+        """Category counts of everything that is no longer in the hot store."""
+        with self._lock:
+            data = self._load()
+            totals = dict(data["expired"])
+            for seg in data["segments"].values():
+                for cat, n in seg["counts"].items():
+                    totals[cat] = totals.get(cat, 0) + n
+            return totals
+
+
+# -------------------------------------------------------
+# SENDER REPUTATION
+# -------------------------------------------------------
+def new_reputation():
+    return {"spam": 0, "threat": 0, "normal": 0, "last_seen": None, "blocked": False}
+
+
+class JsonReputationBacking:
+    """Reputation rows kept in one JSON file, written atomically on flush."""
+
+    def __init__(self, path):
+        self.path = path
+        self._rows = None
+
+    def _load(self):
+        if self._rows is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._rows = json.load(f)
+            except (OSError, ValueError):
+                self._rows = {}
+        return self._rows
+
+    def get(self, address):
+        row = self._load().get(address)
+        return dict(row) if row else None
+
+    def put_many(self, rows):
+        self._load().update(rows)
+        write_json_atomic(self.path, self._rows)
+
+
+class SQLiteReputationBacking:
+    """Reputation rows in an indexed SQLite table (one row per address)."""
+
+    def __init__(self, path):
+        self.db, self._lock = sqlite_connection(path)
+        with self._lock:
+            self.db.execute("""CREATE TABLE IF NOT EXISTS reputation (
+                address TEXT PRIMARY KEY,
+                data TEXT NOT NULL)""")
+            self.db.commit()
+
+    def get(self, address):
+        with self._lock:
+            row = self.db.execute(
+                "SELECT data FROM reputation WHERE address = ?", (address,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_many(self, rows):
+        with self._lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO reputation (address, data) VALUES (?, ?)",
+                [(a, json.dumps(r)) for a, r in rows.items()])
+            self.db.commit()
+
+
+class SenderReputation:
+    """
+    Per-address history: how many spam/threat/normal messages a sender has
+    sent, when they were last seen and whether they were blocked.
+
+    Lookups go through a small in-memory LRU; misses fall through to the
+    persisted backing. Updates are written back every `flush_every` changes
+    (and on flush()).
+    """
+
+    def __init__(self, backing, capacity=256, flush_every=20):
+        self.backing = backing
+        self.capacity = capacity
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._dirty = {}
+
+    def _get(self, address):
+        row = self._cache.get(address)
+        if row is not None:
+            self._cache.move_to_end(address)
+            return row
+        row = self._dirty.get(address) or self.backing.get(address)
+        if row is None:
+            return None
+        self._cache[address] = row
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return row
+
+    def get(self, address):
+        with self._lock:
+            row = self._get(address)
+            return dict(row) if row else None
+
+    def _touch(self, address):
+        row = self._get(address)
+        if row is None:
+            row = new_reputation()
+            self._cache[address] = row
+            if len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+        self._dirty[address] = row
+        return row
+
+    def record(self, entries):
+        """entries: iterable of (address, category, date)."""
+        with self._lock:
+            for address, category, date in entries:
+                if not address:
+                    continue
+                row = self._touch(address)
+                row[category] = row.get(category, 0) + 1
+                if date and (row["last_seen"] is None or date > row["last_seen"]):
+                    row["last_seen"] = date
+            if len(self._dirty) >= self.flush_every:
+                self._flush()
+
+    def mark_blocked(self, address, blocked=True):
+        with self._lock:
+            self._touch(address)["blocked"] = blocked
+            self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._dirty:
+            return
+        try:
+            self.backing.put_many(self._dirty)
+            self._dirty = {}
+        except (OSError, ValueError) as e:
+            print("Failed to save sender reputation:", e)
@@ -0,0 +1,663 @@
+# sos_dispatch.py
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from queue import Queue, Empty
+from kivy.utils import platform
+
+from sos_message import segment_count
+
+IS_ANDROID = platform == "android"
+
+SOS_WORKERS = 4        # concurrent sends
+WORKER_IDLE_EXIT = 30  # seconds a worker waits for work before it exits
+
+
+# -------------------------------------------------------
+# SMS API
+# -------------------------------------------------------
+_sms_manager = None
+
+
+def get_sms_manager():
+    """Resolve Android's SmsManager once; later calls reuse it."""
+    global _sms_manager
+    if _sms_manager is None:
+        from jnius import autoclass
+        _sms_manager = autoclass("android.telephony.SmsManager").getDefault()
+    return _sms_manager
+
+
+def send_text_message(phone, message, track_id=None):
+    """
+    Hand one SMS to the radio; raises if Android refuses it. Messages longer
+    than one segment go out with sendMultipartTextMessage, everything else
+    with a plain sendTextMessage. With track_id the sent/delivered reports
+    are routed to delivery_tracker.
+    """
+    sms = get_sms_manager()
+    parts = None
+    if segment_count(message) > 1:
+        parts = sms.divideMessage(message)
+        if parts.size() < 2:
+            parts = None
+
+    sent_intent = delivery_intent = None
+    if track_id is not None:
+        sent_intent, delivery_intent = delivery_tracker.intents(track_id)
+        delivery_tracker.expect_parts(track_id, parts.size() if parts else 1)
+    if parts is None:
+        sms.sendTextMessage(phone, None, message, sent_intent, delivery_intent)
+        return
+
+    # Every part reports through the same intents; the tracker counts them
+    from jnius import autoclass
+    ArrayList = autoclass("java.util.ArrayList")
+    sent_intents, delivery_intents = ArrayList(), ArrayList()
+    for _ in range(parts.size()):
+        sent_intents.add(sent_intent)
+        delivery_intents.add(delivery_intent)
+    sms.sendMultipartTextMessage(phone, None, parts, sent_intents, delivery_intents)
+
+
+# -------------------------------------------------------
+# RESULT HANDLES
+# -------------------------------------------------------
+class SendResult:
+    """
+    Outcome of one recipient's SMS: status is "pending", "sent" or
+    "failed" (with error). started/finished are time.monotonic() stamps.
+    """
+
+    def __init__(self, recipient):
+        self.recipient = recipient
+        self.status = "pending"
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the send finished (or timeout); returns the status."""
+        self._done.wait(timeout)
+        return self.status
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished = time.monotonic()
+        self._done.set()
+
+
+class FanOut:
+    """
+    One message sent to many recipients. results holds a SendResult per
+    recipient, in the order given; on_complete(fan_out) runs on the worker
+    that finishes the last one.
+    """
+
+    def __init__(self, message, recipients, on_complete=None):
+        self.message = message
+        self.results = [SendResult(r) for r in recipients]
+        self.on_complete = on_complete
+        self.created = time.monotonic()
+        self._lock = threading.Lock()
+        self._remaining = len(self.results)
+        self._done = threading.Event()
+        if not self.results:
+            self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until every recipient finished; True unless timed out."""
+        return self._done.wait(timeout)
+
+    def _result_done(self):
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last:
+            self._done.set()
+            if self.on_complete:
+                try:
+                    self.on_complete(self)
+                except Exception as e:
+                    print("SOS completion callback failed:", e)
+
+    def report(self):
+        """
+        {"recipients", "sent", "failed", "first_ms", "last_ms"}: counts, and
+        time from dispatch until the first / last recipient was handled.
+        """
+        finished = [r.finished - self.created for r in self.results if r.finished is not None]
+        return {
+            "recipients": len(self.results),
+            "sent": sum(1 for r in self.results if r.status == "sent"),
+            "failed": sum(1 for r in self.results if r.status == "failed"),
+            "first_ms": round(min(finished) * 1000, 1) if finished else None,
+            "last_ms": round(max(finished) * 1000, 1) if finished else None,
+        }
+
+
+# -------------------------------------------------------
+# DISPATCHER
+# -------------------------------------------------------
+class SOSDispatcher:
+    """
+    Sends one message to many recipients concurrently through a bounded
+    pool of worker threads, so the last contact is reached about as soon as
+    the first. Workers start on demand and exit after WORKER_IDLE_EXIT
+    seconds without work (detaching from Java on the way out).
+    """
+
+    def __init__(self, workers=SOS_WORKERS, idle_exit=WORKER_IDLE_EXIT):
+        self.workers = workers
+        self.idle_exit = idle_exit
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def dispatch(self, recipients, message, send, on_complete=None):
+        """
+        Queue send(recipient, message) for every recipient and return a
+        FanOut handle immediately. send() reports failure by raising.
+        """
+        fan_out = FanOut(message, recipients, on_complete)
+        for result in fan_out.results:
+            self._queue.put((fan_out, result, send))
+        if fan_out.results:
+            self._start_workers(len(fan_out.results))
+        return fan_out
+
+    def _start_workers(self, jobs):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            wanted = min(self.workers, len(self._threads) + jobs)
+            while len(self._threads) < wanted:
+                t = threading.Thread(target=self._worker, name="sos-send", daemon=True)
+                self._threads.append(t)
+                t.start()
+
+    def _next_job(self):
+        while True:
+            try:
+                return self._queue.get(timeout=self.idle_exit)
+            except Empty:
+                with self._lock:
+                    # Re-check under the lock so dispatch() either sees this
+                    # worker gone or this worker sees the new job.
+                    if self._queue.empty():
+                        self._threads.remove(threading.current_thread())
+                        return None
+
+    def _worker(self):
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                fan_out, result, send = job
+                result.started = time.monotonic()
+                try:
+                    send(result.recipient, fan_out.message)
+                except Exception as e:
+                    result._finish("failed", e)
+                else:
+                    result._finish("sent")
+                fan_out._result_done()
+        finally:
+            if IS_ANDROID:
+                # Threads that touched Java must detach before they exit
+                from jnius import detach
+                detach()
+
+
+sos_dispatcher = SOSDispatcher()
+
+
+# -------------------------------------------------------
+# DELIVERY TRACKING
+# -------------------------------------------------------
+SENT_ACTION = "org.soso.SOS_SMS_SENT"
+DELIVERED_ACTION = "org.soso.SOS_SMS_DELIVERED"
+RESULT_OK = -1  # Activity.RESULT_OK
+SEND_ERRORS = {1: "generic failure", 2: "radio off", 3: "null PDU", 4: "no service"}
+TRACKED_MAX = 500
+
+
+class DeliveryTracker:
+    """
+    Follows tracked SMS through Android's "sent" and "delivered" broadcasts.
+    Each SMS is keyed by its outbox entry id; the record keeps the time from
+    hand-off to each report. on_sent(track_id, error) is called once an SMS
+    is settled (error is None on success) so the outbox can confirm or
+    retry the entry. A multipart SMS counts as sent/delivered once every
+    part is; the first failed part fails the whole attempt.
+    """
+
+    def __init__(self, capacity=TRACKED_MAX):
+        self.capacity = capacity
+        self.on_sent = None
+        self._lock = threading.Lock()
+        self._records = OrderedDict()
+        self._receivers = []
+        self._request_code = 0
+
+    @property
+    def active(self):
+        return bool(self._receivers)
+
+    # ---------------- Android Plumbing ----------------
+    def register(self):
+        """Start listening for the sent/delivered broadcasts (Android only)."""
+        if not IS_ANDROID or self._receivers:
+            return
+        from android.broadcast import BroadcastReceiver
+        sent = BroadcastReceiver(self._on_sent_broadcast, actions=[SENT_ACTION])
+        delivered = BroadcastReceiver(self._on_delivered_broadcast, actions=[DELIVERED_ACTION])
+        sent.start()
+        delivered.start()
+        self._receivers = [sent, delivered]
+
+    def unregister(self):
+        for receiver in self._receivers:
+            receiver.stop()
+        self._receivers = []
+
+    def intents(self, track_id):
+        """(sentIntent, deliveryIntent) PendingIntents carrying track_id."""
+        from jnius import autoclass
+        PythonActivity = autoclass('org.kivy.android.PythonActivity')
+        Intent = autoclass('android.content.Intent')
+        PendingIntent = autoclass('android.app.PendingIntent')
+        context = PythonActivity.mActivity
+        # The delivery report is filled into its intent, so that one must
+        # stay mutable on Android 12+.
+        flags = (
+            PendingIntent.FLAG_UPDATE_CURRENT | getattr(PendingIntent, "FLAG_IMMUTABLE", 0),
+            PendingIntent.FLAG_UPDATE_CURRENT | getattr(PendingIntent, "FLAG_MUTABLE", 0),
+        )
+        intents = []
+        for action, flag in zip((SENT_ACTION, DELIVERED_ACTION), flags):
+            with self._lock:
+                self._request_code += 1
+                code = self._request_code
+            intent = Intent(action)
+            intent.setPackage(context.getPackageName())
+            intent.putExtra("outbox_id", track_id)
+            intents.append(PendingIntent.getBroadcast(context, code, intent, flag))
+        return intents
+
+    def _on_sent_broadcast(self, context, intent):
+        track_id = intent.getStringExtra("outbox_id")
+        code = self._receivers[0].receiver.getResultCode()
+        error = None if code == RESULT_OK else SEND_ERRORS.get(code, f"error {code}")
+        if self.sent(track_id, error) and self.on_sent and track_id:
+            self.on_sent(track_id, error)
+
+    def _on_delivered_broadcast(self, context, intent):
+        ok = True
+        pdu = intent.getByteArrayExtra("pdu")
+        if pdu is not None:
+            from jnius import autoclass
+            SmsMessage = autoclass('android.telephony.SmsMessage')
+            pdu_format = intent.getStringExtra("format")
+            if pdu_format:
+                status = SmsMessage.createFromPdu(pdu, pdu_format).getStatus()
+            else:
+                status = SmsMessage.createFromPdu(pdu).getStatus()
+            # TP-Status: 0x00-0x1F delivered, 0x20-0x3F still trying, else failed
+            if 0x20 <= status < 0x40:
+                return
+            ok = status < 0x20
+        self.delivered(intent.getStringExtra("outbox_id"), ok)
+
+    # ---------------- Records ----------------
+    def track(self, track_id, phone, name=""):
+        """Start timing an SMS (or a retry of it) about to be handed to the radio."""
+        with self._lock:
+            previous = self._records.pop(track_id, None)
+            self._records[track_id] = {
+                "id": track_id,
+                "phone": phone,
+                "name": name,
+                "queued": time.monotonic(),
+                "attempts": previous["attempts"] + 1 if previous else 1,
+                "failures": previous["failures"] if previous else 0,
+                "parts": 1,
+                "parts_sent": 0,
+                "parts_delivered": 0,
+                "status": "pending",
+                "error": None,
+                "sent_ms": None,
+                "delivered_ms": None,
+            }
+            while len(self._records) > self.capacity:
+                self._records.popitem(last=False)
+
+    def expect_parts(self, track_id, parts):
+        """The SMS goes out as `parts` segments, each with its own reports."""
+        with self._lock:
+            record = self._records.get(track_id)
+            if record is not None:
+                record["parts"] = parts
+
+    def _elapsed_ms(self, record):
+        return round((time.monotonic() - record["queued"]) * 1000, 1)
+
+    def sent(self, track_id, error=None):
+        """
+        Record the sent report (or a hand-off failure) for one SMS or one of
+        its parts. Returns True if this report settles the SMS; untracked
+        ids are always passed on.
+        """
+        with self._lock:
+            record = self._records.get(track_id)
+            if record is None:
+                return True
+            if record["status"] != "pending":
+                return False  # later parts of an attempt that already failed
+            if error is None:
+                record["parts_sent"] += 1
+                if record["parts_sent"] < record["parts"]:
+                    return False
+            record["sent_ms"] = self._elapsed_ms(record)
+            record["status"] = "sent" if error is None else "failed"
+            record["error"] = error
+            if error is not None:
+                record["failures"] += 1
+            return True
+
+    def delivered(self, track_id, ok=True):
+        with self._lock:
+            record = self._records.get(track_id)
+            if record is None or record["status"] not in ("pending", "sent"):
+                return
+            if ok:
+                record["parts_delivered"] += 1
+                if record["parts_delivered"] < record["parts"]:
+                    return
+            record["delivered_ms"] = self._elapsed_ms(record)
+            record["status"] = "delivered" if ok else "undelivered"
+            if not ok:
+                record["failures"] += 1
+        if ok:
+            print(f"SOS SMS to {record['phone']} delivered after {record['delivered_ms']} ms")
+
+    def records(self):
+        with self._lock:
+            return [dict(r) for r in self._records.values()]
+
+    # ---------------- Stats ----------------
+    @staticmethod
+    def _summary(records):
+        sent = [r["sent_ms"] for r in records if r["status"] in ("sent", "delivered", "undelivered")]
+        delivered = [r["delivered_ms"] for r in records if r["status"] == "delivered"]
+        return {
+            "tracked": len(records),
+            "attempts": sum(r["attempts"] for r in records),
+            "sent": len(sent),
+            "failed": sum(r["failures"] for r in records),
+            "delivered": len(delivered),
+            "avg_sent_ms": round(sum(sent) / len(sent), 1) if sent else None,
+            "avg_delivered_ms": round(sum(delivered) / len(delivered), 1) if delivered else None,
+            "max_delivered_ms": max(delivered) if delivered else None,
+        }
+
+    def stats(self):
+        """
+        Totals and average/max latency (ms from the last hand-off) over recent
+        SMS; "failed" counts failed attempts, including ones later retried.
+        """
+        return self._summary(self.records())
+
+    def recipient_stats(self):
+        """The same summary per phone number."""
+        by_phone = {}
+        for r in self.records():
+            by_phone.setdefault(r["phone"], []).append(r)
+        return {phone: self._summary(records) for phone, records in by_phone.items()}
+
+
+delivery_tracker = DeliveryTracker()
+
+
+# -------------------------------------------------------
+# DURABLE OUTBOX
+# -------------------------------------------------------
+OUTBOX_FILE = "sos_outbox.jsonl"
+RETRY_BASE_DELAY = 5.0     # seconds before the first retry, doubled each time
+RETRY_MAX_DELAY = 300.0
+MAX_ATTEMPTS = 10
+OUTBOX_COMPACT_AFTER = 200  # finished entries before the journal is rewritten
+SENT_CONFIRM_TIMEOUT = 120.0  # resend a tracked SMS if Android never reports it sent
+
+
+class SOSOutbox:
+    """
+    Crash-safe queue of SOS SMS. Each message is written to an append-only
+    journal (fsync'ed) before it is sent, and marked done once the radio
+    accepts it. Failed sends are retried with exponential backoff by a
+    background scheduler thread; start() reloads the journal and resends
+    whatever an earlier run left pending. With an active DeliveryTracker an
+    entry is only done once Android reports it sent; a failed report, or no
+    report within confirm_timeout, is retried like any other failure.
+
+    Journal lines: {"op": "add", <entry>}, {"op": "retry", "id", "attempts",
+    "next_at", "error"}, {"op": "done", "id"} and {"op": "gave_up", "id"}.
+    """
+
+    def __init__(self, path=OUTBOX_FILE, send=send_text_message, dispatcher=None,
+                 base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 max_attempts=MAX_ATTEMPTS, tracker=None, confirm_timeout=SENT_CONFIRM_TIMEOUT):
+        self.path = path
+        self.send_func = send
+        self.dispatcher = dispatcher or sos_dispatcher
+        self.tracker = tracker
+        if tracker is not None:
+            tracker.on_sent = self._on_sent_report
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.confirm_timeout = confirm_timeout
+        self._cond = threading.Condition()
+        self._entries = {}
+        self._in_flight = set()
+        self._awaiting = set()  # handed to the radio, sent report not in yet
+        self._finished = 0
+        self._handle = None
+        self._thread = None
+
+    # ---------------- Journal ----------------
+    def _load(self):
+        self._entries = {}
+        self._finished = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn last line
+                op = rec.pop("op", None)
+                if op == "add":
+                    self._entries[rec["id"]] = rec
+                elif op == "retry" and rec.get("id") in self._entries:
+                    entry = self._entries[rec["id"]]
+                    entry["attempts"] = rec.get("attempts", entry["attempts"])
+                    entry["next_at"] = rec.get("next_at", entry["next_at"])
+                elif op in ("done", "gave_up"):
+                    if self._entries.pop(rec.get("id"), None) is not None:
+                        self._finished += 1
+
+    def _log(self, records):
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        self._handle.write(lines)
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+
+    def _compact(self):
+        if self._handle is not None:
+            self._handle.close()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps({"op": "add", **entry}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._handle = open(self.path, "a", encoding="utf-8")
+        self._finished = 0
+
+    # ---------------- Setup ----------------
+    def start(self):
+        """Load the journal, resend pending entries now and start retrying."""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._load()
+            self._compact()
+            now = time.time()
+            for entry in self._entries.values():
+                entry["next_at"] = min(entry["next_at"], now)
+            self._thread = threading.Thread(target=self._scheduler, name="sos-outbox", daemon=True)
+            self._thread.start()
+            self._cond.notify()
+
+    def pending(self):
+        """Copies of the entries not yet sent."""
+        with self._cond:
+            return [dict(e) for e in self._entries.values()]
+
+    # ---------------- Send ----------------
+    def send(self, recipients, message, on_complete=None):
+        """
+        Record one SOS SMS per recipient ({"name", "phone"}) and send them
+        all at once. Returns the FanOut of the first attempt; failures are
+        retried from the outbox afterwards.
+        """
+        self.start()
+        now = time.time()
+        entries = []
+        with self._cond:
+            for r in recipients:
+                entry = {
+                    "id": uuid.uuid4().hex[:12],
+                    "name": r.get("name", ""),
+                    "phone": r["phone"],
+                    "message": message,
+                    "created": now,
+                    "attempts": 0,
+                    "next_at": now,
+                }
+                self._entries[entry["id"]] = entry
+                self._in_flight.add(entry["id"])
+                entries.append(entry)
+            if entries:
+                self._log([{"op": "add", **e} for e in entries])
+        return self.dispatcher.dispatch(entries, message, self._attempt, on_complete)
+
+    def _attempt(self, entry, _message):
+        tracked = self.tracker is not None and self.tracker.active
+        if tracked:
+            self.tracker.track(entry["id"], entry["phone"], entry.get("name", ""))
+        try:
+            self.send_func(entry["phone"], entry["message"], entry["id"] if tracked else None)
+        except Exception as e:
+            if tracked:
+                self.tracker.sent(entry["id"], str(e))
+            self._failed(entry, e)
+            raise
+        if tracked:
+            self._handed(entry)
+        else:
+            self._sent(entry)
+
+    def _handed(self, entry):
+        # Wait for the sent report; a missing one counts as a failed attempt
+        with self._cond:
+            if entry["id"] in self._in_flight:
+                self._in_flight.discard(entry["id"])
+                self._awaiting.add(entry["id"])
+                entry["next_at"] = time.time() + self.confirm_timeout
+                self._cond.notify()
+
+    def _on_sent_report(self, track_id, error):
+        with self._cond:
+            entry = self._entries.get(track_id)
+            # A late failure for an attempt that already timed out was counted
+            current = track_id in self._in_flight or track_id in self._awaiting
+        if entry is None:
+            return
+        if error is None:
+            self._sent(entry)
+        elif current:
+            self._failed(entry, error)
+
+    def _sent(self, entry):
+        with self._cond:
+            self._in_flight.discard(entry["id"])
+            self._awaiting.discard(entry["id"])
+            if self._entries.pop(entry["id"], None) is None:
+                return
+            self._log([{"op": "done", "id": entry["id"]}])
+            self._finished += 1
+            if self._finished >= OUTBOX_COMPACT_AFTER:
+                self._compact()
+
+    def _failed(self, entry, error):
+        with self._cond:
+            self._in_flight.discard(entry["id"])
+            self._awaiting.discard(entry["id"])
+            if entry["id"] not in self._entries:
+                return
+            entry["attempts"] += 1
+            if entry["attempts"] >= self.max_attempts:
+                del self._entries[entry["id"]]
+                self._log([{"op": "gave_up", "id": entry["id"]}])
+                self._finished += 1
+                print(f"Giving up on SOS SMS to {entry['phone']}: {error}")
+                return
+            delay = min(self.max_delay, self.base_delay * 2 ** (entry["attempts"] - 1))
+            entry["next_at"] = time.time() + delay
+            self._log([{"op": "retry", "id": entry["id"], "attempts": entry["attempts"],
+                        "next_at": entry["next_at"], "error": str(error)}])
+            self._cond.notify()
+        print(f"SOS SMS to {entry['phone']} failed ({error}); retrying in {delay:.0f} s")
+
+    # ---------------- Retry Scheduler ----------------
+    def _due(self):
+        now = time.time()
+        for entry in [e for e in self._entries.values() if e["id"] in self._awaiting]:
+            if entry["next_at"] <= now:
+                self._failed(entry, "no sent report")
+        waiting = [e for e in self._entries.values() if e["id"] not in self._in_flight]
+        due = [e for e in waiting if e["next_at"] <= now]
+        if due or not waiting:
+            return due, None
+        return due, min(e["next_at"] for e in waiting) - now
+
+    def _scheduler(self):
+        while True:
+            with self._cond:
+                due, wait = self._due()
+                while not due:
+                    self._cond.wait(wait)
+                    due, wait = self._due()
+                for entry in due:
+                    self._in_flight.add(entry["id"])
+            self.dispatcher.dispatch(due, None, self._attempt)
+
+
+sos_outbox = SOSOutbox(tracker=delivery_tracker)
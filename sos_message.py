@@ -0,0 +1,101 @@
+# sos_message.py
+import math
+
+# -------------------------------------------------------
+# SMS SEGMENT COST
+# -------------------------------------------------------
+# GSM 03.38 default alphabet (7-bit); extension characters take an escape
+# septet plus their own. Anything else forces the whole SMS into UCS-2.
+GSM7_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENSION = set("^{}\\[~]|€\f")
+
+GSM7_SINGLE = 160   # septets in a single SMS
+GSM7_PART = 153     # septets per part once a user data header is needed
+UCS2_SINGLE = 70    # UTF-16 code units
+UCS2_PART = 67
+
+# Look-alikes that would otherwise turn a 160-character SMS into a 70-character one
+GSM7_FALLBACKS = {
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "…": "...", "\u00a0": " ",
+}
+
+
+def to_gsm7(text):
+    """Replace smart quotes, dashes etc. with their GSM-7 equivalents."""
+    return "".join(GSM7_FALLBACKS.get(ch, ch) for ch in text)
+
+
+def segment_info(text):
+    """
+    Return (encoding, units, segments) for text: "gsm7" with a septet
+    count or "ucs2" with a UTF-16 code unit count.
+    """
+    units = 0
+    for ch in text:
+        if ch in GSM7_BASIC:
+            units += 1
+        elif ch in GSM7_EXTENSION:
+            units += 2
+        else:
+            units = len(text.encode("utf-16-le")) // 2
+            single, part, encoding = UCS2_SINGLE, UCS2_PART, "ucs2"
+            break
+    else:
+        single, part, encoding = GSM7_SINGLE, GSM7_PART, "gsm7"
+    if units <= single:
+        return encoding, units, 1
+    return encoding, units, math.ceil(units / part)
+
+
+def segment_count(text):
+    return segment_info(text)[2]
+
+
+# -------------------------------------------------------
+# SOS MESSAGE BUILDER
+# -------------------------------------------------------
+MAPS_URL = "https://maps.google.com/?q="
+SHORT_MAPS_URL = "maps.google.com/?q="
+
+
+def compact_coord(value, digits):
+    """Coordinate with at most `digits` decimals and no trailing zeros."""
+    text = f"{value:.{digits}f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def _location_forms(lat, lon):
+    """Location payloads, richest first (5 decimals ~1 m, 4 decimals ~11 m)."""
+    if lat is None or lon is None:
+        return ["Location unknown."]
+    fine = f"{compact_coord(lat, 5)},{compact_coord(lon, 5)}"
+    coarse = f"{compact_coord(lat, 4)},{compact_coord(lon, 4)}"
+    return [
+        f"Location: {MAPS_URL}{fine}",
+        f"Location: {SHORT_MAPS_URL}{fine}",
+        f"{SHORT_MAPS_URL}{coarse}",
+        coarse,
+    ]
+
+
+def build_sos_message(category=None, lat=None, lon=None, details=""):
+    """
+    SOS text for category at (lat, lon). The location is shortened step by
+    step until the message fits one SMS; if even the shortest form does not
+    fit (long details), the form needing the fewest parts is used.
+    """
+    head = f"EMERGENCY ({category})!" if category else "SOS!"
+    tail = f" {details.strip()}" if details and details.strip() else ""
+    best = None
+    for location in _location_forms(lat, lon):
+        text = to_gsm7(f"{head} {location}{tail}")
+        segments = segment_count(text)
+        if segments == 1:
+            return text
+        if best is None or segments < best[0]:
+            best = (segments, text)
+    return best[1]
@@ -15,6 +15,8 @@ from main import MainScreen
 from main import MapEditorScreen
 from contacts import ContactsScreen
 from spam_detail import SpamDetailScreen
+from sms_manager import flush_all
+from sos_dispatch import sos_outbox, delivery_tracker, IS_ANDROID
 from button_settings import ButtonSettingsScreen
 from help import HelpScreen
 from profile import ProfileScreen
@@ -1269,13 +1271,36 @@ ScreenManager:
                 valign: "middle"
                 text_size: self.size
 
-        # ----- Scrollable list of messages -----
-        ScrollView:
+        # ----- Search (words, from:<number>, since:<date>, until:<date>) -----
+        BoxLayout:
+            size_hint_y: None
+            height: dp(40)
+            spacing: dp(5)
+
+            TextInput:
+                id: search_input
+                hint_text: "Search e.g. prize from:0917... since:2024-05"
+                multiline: False
+                on_text_validate: root.run_search(self.text)
+
+            Button:
+                text: "Search"
+                size_hint_x: None
+                width: dp(80)
+                on_release: root.run_search(search_input.text)
+
+        # ----- Scrollable list of messages (rows are recycled, pages load on scroll) -----
+        RecycleView:
+            id: spam_list
+            viewclass: "SpamRow"
             do_scroll_x: False
+            on_scroll_y: root.on_list_scroll(self.scroll_y)
 
-            BoxLayout:
-                id: spam_container
+            RecycleBoxLayout:
+                id: spam_layout
                 orientation: "vertical"
+                default_size: None, dp(50)
+                default_size_hint: 1, None
                 size_hint_y: None
                 height: self.minimum_height
                 spacing: dp(8)
@@ -1296,6 +1321,15 @@ ScreenManager:
                 on_release: root.toggle_block(self)
 
 # ----- Style for individual spam/threat messages -----
+<SpamRow>:
+    background_normal: ""
+    background_color: (0.2, 0.2, 0.2, 1)
+    shorten: True
+    shorten_from: "right"
+    text_size: self.width - dp(20), None
+    halign: "left"
+    valign: "middle"
+
 <SpamMessageButton@Button>:
     size_hint_y: None
     height: dp(60)
@@ -1552,6 +1586,20 @@ class LoginApp(MDApp):
         contact_field.text = self.selected_country_code + " "
         contact_field.cursor = (len(contact_field.text), 0)  # place cursor at end
 
+        # Track SOS delivery reports, then resend what a previous run could not deliver
+        if IS_ANDROID:
+            delivery_tracker.register()
+            sos_outbox.start()
+
+    # ---------------- App Lifecycle ----------------
+    def on_pause(self):
+        """Android may kill a paused app, so commit buffered SMS data first."""
+        flush_all()
+        return True
+
+    def on_stop(self):
+        flush_all()
+
     def select_country_code(self, code):
         """Called when a country is selected from dropdown."""
         self.selected_country_code = code
@@ -4,6 +4,8 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 
+from spam_scorer import SpamScorer, keyword_weights
+
 class SpamDetector(BoxLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -23,6 +25,7 @@ class SpamDetector(BoxLayout):
             {"id": "4", "keyword": "urgent"},
             {"id": "5", "keyword": "limited time"},
         ]
+        self.scorer = SpamScorer(keyword_weights(k["keyword"] for k in self.spam_keywords))
 
         # TextInput (larger)
         self.input = TextInput(
@@ -54,9 +57,7 @@ class SpamDetector(BoxLayout):
 
     def check_spam(self, instance):
         self.message = self.input.text.strip().lower()
-        self.is_spam = any(
-            keyword["keyword"] in self.message for keyword in self.spam_keywords
-        )
+        self.is_spam = self.scorer.classify(self.message) != "normal"
         if self.is_spam:
             self.result_label.text = "⚠️ Spam detected!"
         else:
@@ -1,5 +1,6 @@
 from kivy.uix.screenmanager import Screen
-from kivy.properties import ListProperty, NumericProperty, BooleanProperty
+from kivy.properties import ListProperty, NumericProperty, BooleanProperty, StringProperty, ObjectProperty
+from kivy.clock import Clock
 from kivy.uix.label import Label
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
@@ -7,7 +8,31 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.popup import Popup
 from datetime import datetime
 
-from sms_manager import load_spam, save_spam, get_grouped_spam, block_sms
+from sms_manager import (
+    save_spam, get_spam_counts, get_spam_page, SPAM_PAGE_SIZE, search_spam,
+    block_sms, classify_message, get_spam_keywords, update_spam_keywords, ui_refresh,
+)
+
+SPAM_COLOR = (1, 0.9, 0, 1)
+THREAT_COLOR = (1, 0.3, 0.3, 1)
+
+# Fetch the next page once the list is scrolled this close to the bottom
+# (scroll_y goes from 1 at the top to 0 at the bottom).
+LOAD_MORE_AT = 0.1
+
+
+class SpamRow(Button):
+    """
+    One row of the message list. The RecycleView only creates enough rows
+    to fill the screen and re-binds them to other messages while scrolling.
+    """
+    message = StringProperty("")
+    category = StringProperty("spam")
+    screen = ObjectProperty(None, allownone=True)
+
+    def on_release(self):
+        if self.screen is not None:
+            self.screen.open_popup(self.message, self.category)
 
 
 class SpamDetailScreen(Screen):
@@ -15,45 +40,124 @@ class SpamDetailScreen(Screen):
     spam_count = NumericProperty(0)
     threat_count = NumericProperty(0)
 
-    # User-defined spam keywords
-    spam_keywords = ListProperty(["free", "win", "prize", "claim", "₱", "lottery"])
+    # User-defined spam keywords, shared with (and saved by) sms_manager
+    spam_keywords = ListProperty(get_spam_keywords())
 
     # Toggle blocking spam SMS
     block_enabled = BooleanProperty(False)
 
+    # False once the last page of the store has been loaded
+    has_more = BooleanProperty(True)
+
+    # Current search box query ("" shows every message)
+    search_query = StringProperty("")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._loading = False
+        ui_refresh.bind(self.on_new_spam)
+
+    def on_new_spam(self, delta):
+        """Apply a burst of newly received messages in one refresh."""
+        self.spam_count += delta["spam"]
+        self.threat_count += delta["threat"]
+        if self.manager and self.manager.current == self.name and not self.search_query:
+            # The list is newest first, so new messages go on top
+            new = list(reversed(delta["messages"]))
+            self.spam_messages = new + list(self.spam_messages)
+            rv = self.ids.spam_list
+            rv.data = [self.row_data(m) for m in new] + list(rv.data)
+
+    def on_spam_keywords(self, instance, value):
+        """Rebuild the classifier and re-check the archive whenever the keyword list is edited."""
+        update_spam_keywords(value, on_complete=self.on_reclassified)
+
+    def on_reclassified(self, changed, cancelled):
+        """Refresh counts once a background re-classification has finished."""
+        if cancelled or not changed:
+            return
+        if self.manager and self.manager.current == self.name:
+            self.on_pre_enter()
+        if self.manager and "main" in self.manager.screen_names:
+            self.manager.get_screen("main").update_counter()
+
     def on_pre_enter(self):
-        """Load spam + threat messages before screen appears."""
-        data = get_grouped_spam()
-        self.spam_messages = data["all"]
-        self.spam_count = data["spam"]
-        self.threat_count = data["threat"]
-        self.load_list()
+        """Load the counters and the first page of messages before screen appears."""
+        counts = get_spam_counts()
+        self.spam_count = counts["spam"]
+        self.threat_count = counts["threat"]
+        if self.search_query:
+            self.run_search(self.search_query)
+        else:
+            self.load_list()
 
     def load_list(self):
-        """Fill UI list with messages."""
-        container = self.ids.spam_container
-        container.clear_widgets()
-
-        # Display spam messages
-        for msg in self.spam_messages:
-            text = msg["message"]
-            category = msg["category"]
-            color = (1, 0.9, 0, 1) if category == "spam" else (1, 0.3, 0.3, 1)
-
-            btn = Button(
-                text=text,
-                size_hint_y=None,
-                height=50,
-                background_normal="",
-                background_color=(0.2, 0.2, 0.2, 1),
-                color=color
-            )
-            btn.bind(on_release=lambda b, t=text, c=category: self.open_popup(t, c))
-            container.add_widget(btn)
+        """Restart the list from the newest message."""
+        self.spam_messages = []
+        self.ids.spam_list.data = []
+        self.ids.spam_list.scroll_y = 1
+        self.has_more = True
+        self._loading = False
+        self.load_next_page()
+
+    def row_data(self, msg):
+        """View attributes for one message row."""
+        category = msg.get("category", "spam")
+        return {
+            "text": msg.get("message", ""),
+            "message": msg.get("message", ""),
+            "category": category,
+            "color": SPAM_COLOR if category == "spam" else THREAT_COLOR,
+            "screen": self,
+        }
+
+    # ---------------- Search ----------------
+    def run_search(self, query):
+        """Show the messages matching the search box, or all of them if it is empty."""
+        self.search_query = query.strip()
+        if not self.search_query:
+            self.load_list()
+            return
+        results = search_spam(self.search_query)
+        self.spam_messages = results
+        self.has_more = False
+        rv = self.ids.spam_list
+        rv.data = [self.row_data(m) for m in results]
+        rv.scroll_y = 1
+
+    # ---------------- Paging ----------------
+    def on_list_scroll(self, scroll_y):
+        if scroll_y <= LOAD_MORE_AT:
+            self.load_next_page()
+
+    def load_next_page(self):
+        """Append the next page of older messages to the list."""
+        if self._loading or not self.has_more:
+            return
+        self._loading = True
+        page = get_spam_page(len(self.spam_messages), SPAM_PAGE_SIZE)
+        self.has_more = len(page) == SPAM_PAGE_SIZE
+
+        rv = self.ids.spam_list
+        layout = self.ids.spam_layout
+        # Distance scrolled from the top, kept fixed while rows are added
+        # below; otherwise the view would jump to the new bottom and load
+        # every page in a row.
+        scrolled = (1 - rv.scroll_y) * max(layout.height - rv.height, 0)
+        self.spam_messages.extend(page)
+        rv.data.extend(self.row_data(m) for m in page)
+        Clock.schedule_once(lambda dt: self._restore_scroll(scrolled), 0)
+
+    def _restore_scroll(self, scrolled):
+        rv = self.ids.spam_list
+        scrollable = self.ids.spam_layout.height - rv.height
+        if scrollable > 0:
+            rv.scroll_y = max(1 - scrolled / scrollable, 0)
+        self._loading = False
 
     def open_popup(self, message, category):
         """Popup showing full message."""
-        color = (1, 0.9, 0, 1) if category == "spam" else (1, 0.3, 0.3, 1)
+        color = SPAM_COLOR if category == "spam" else THREAT_COLOR
         content = BoxLayout(orientation="vertical", spacing=10, padding=10)
         lbl = Label(text=message, color=color)
         close_btn = Button(text="Close", size_hint_y=None, height=40)
@@ -108,23 +212,21 @@ class SpamDetailScreen(Screen):
     # ---------------- Spam Detection ----------------
     def detect_and_block(self, message, sender="Unknown"):
         """
-        Detect spam using user-defined keywords.
-        Save to spam DB and block if block_enabled is True.
+        Detect spam/threats with the shared scorer (which includes the
+        user-defined keywords). Save to spam DB and block if block_enabled is True.
         """
-        msg_lower = message.lower()
-        for kw in self.spam_keywords:
-            if kw in msg_lower:
-                # Add to spam DB
-                spam_entry = {
-                    "address": sender,
-                    "message": message,
-                    "date": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    "category": "spam"
-                }
-                save_spam([spam_entry])
-                self.on_pre_enter()  # refresh UI list
-
-                # Block if enabled
-                if self.block_enabled:
-                    block_sms(spam_entry)
-                break
+        category = classify_message(message)
+        if category != "normal":
+            # Add to spam DB
+            spam_entry = {
+                "address": sender,
+                "message": message,
+                "date": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                "category": category
+            }
+            save_spam([spam_entry])
+            self.on_pre_enter()  # refresh UI list
+
+            # Block if enabled
+            if self.block_enabled:
+                block_sms(spam_entry)
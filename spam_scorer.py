@@ -0,0 +1,217 @@
+# spam_scorer.py
+import math
+import os
+import re
+import struct
+
+
+# -------------------------------------------------------
+# TOKENIZER
+# -------------------------------------------------------
+# Words/numbers, or single symbols such as "₱" or "!".
+TOKEN_RE = re.compile(r"[^\W_]+|[^\w\s]")
+_BATCH_TOKEN_RE = re.compile(r"[^\W_]+|[^\w\s]|\n")
+
+# Tried (in order) when a word is not in the table, so "kills", "winner",
+# "attackers" and "lotteries" still match "kill", "win", "attack" and
+# "lottery" while "window" or "Bombay" match nothing. (suffix, replacement) pairs.
+SUFFIXES = (("ings", ""), ("ing", ""), ("ies", "y"), ("ers", ""), ("er", ""),
+            ("ed", ""), ("ed", "e"), ("es", ""), ("s", ""))
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+# -------------------------------------------------------
+# WEIGHT TABLE FILE
+# -------------------------------------------------------
+# Layout (little-endian):
+#   header: magic "SOSW", version (u8), entry count (u32),
+#           spam bias (f32), threat bias (f32)
+#   entry:  spam weight (f32), threat weight (f32), length (u8), utf-8 feature
+# A feature is one token or several tokens joined by a single space.
+MAGIC = b"SOSW"
+VERSION = 1
+_HEADER = struct.Struct("<4sBIff")
+_ENTRY = struct.Struct("<ffB")
+
+# Defaults used when a table is compiled from plain keyword lists:
+# one keyword hit is enough to cross the 0.5 decision threshold.
+DEFAULT_BIAS = -3.0
+DEFAULT_KEYWORD_WEIGHT = 5.0
+
+
+def save_weights(path, weights, spam_bias=DEFAULT_BIAS, threat_bias=DEFAULT_BIAS):
+    """Write {feature: (spam_weight, threat_weight)} as a binary table."""
+    chunks = [_HEADER.pack(MAGIC, VERSION, len(weights), spam_bias, threat_bias)]
+    for feature, (spam_w, threat_w) in weights.items():
+        raw = feature.encode("utf-8")[:255]
+        chunks.append(_ENTRY.pack(spam_w, threat_w, len(raw)))
+        chunks.append(raw)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(chunks))
+    os.replace(tmp_path, path)
+
+
+def load_weights(path):
+    """Read a binary table. Returns (weights, spam_bias, threat_bias)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        magic, version, count, spam_bias, threat_bias = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a SOSO weight table")
+
+        weights = {}
+        pos = _HEADER.size
+        for _ in range(count):
+            spam_w, threat_w, length = _ENTRY.unpack_from(data, pos)
+            pos += _ENTRY.size
+            weights[data[pos:pos + length].decode("utf-8")] = (spam_w, threat_w)
+            pos += length
+    except struct.error as e:
+        raise ValueError(f"{path} is truncated") from e
+    return weights, spam_bias, threat_bias
+
+
+def keyword_weights(spam_keywords=(), threat_keywords=(), weight=DEFAULT_KEYWORD_WEIGHT):
+    """Turn plain keyword lists into table entries."""
+    weights = {}
+    for kw in spam_keywords:
+        feature = " ".join(tokenize(kw))
+        if feature:
+            weights[feature] = (weight, weights.get(feature, (0.0, 0.0))[1])
+    for kw in threat_keywords:
+        feature = " ".join(tokenize(kw))
+        if feature:
+            weights[feature] = (weights.get(feature, (0.0, 0.0))[0], weight)
+    return weights
+
+
+# -------------------------------------------------------
+# SCORER
+# -------------------------------------------------------
+def _sigmoid(x):
+    if x < -30:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+class SpamScorer:
+    """
+    Naive-Bayes style scorer: each feature (a token or a short token
+    sequence) found in a message adds its log-odds weight to the class
+    bias, and the sums become spam/threat probabilities.
+    """
+
+    def __init__(self, weights=None, spam_bias=DEFAULT_BIAS, threat_bias=DEFAULT_BIAS,
+                 threshold=0.5):
+        self.weights = dict(weights or {})
+        self.spam_bias = spam_bias
+        self.threat_bias = threat_bias
+        self.threshold = threshold
+        self.max_ngram = max((f.count(" ") + 1 for f in self.weights), default=1)
+        self._threat_weights = {f: w for f, w in self.weights.items() if w[1]}
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        weights, spam_bias, threat_bias = load_weights(path)
+        return cls(weights, spam_bias, threat_bias, **kwargs)
+
+    def save(self, path):
+        save_weights(path, self.weights, self.spam_bias, self.threat_bias)
+
+    def with_keywords(self, spam_keywords=(), threat_keywords=()):
+        """Return a copy whose table also contains the given keywords."""
+        weights = dict(self.weights)
+        weights.update(keyword_weights(spam_keywords, threat_keywords))
+        return SpamScorer(weights, self.spam_bias, self.threat_bias, self.threshold)
+
+    # ---------------- Scoring ----------------
+    def _lookup(self, token, weights):
+        w = weights.get(token)
+        if w is None:
+            for suffix, replacement in SUFFIXES:
+                if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+                    stem = token[:-len(suffix)] + replacement
+                    w = weights.get(stem)
+                    if w is None and len(stem) > 3 and stem[-1] == stem[-2]:
+                        w = weights.get(stem[:-1])  # "winning" -> "win"
+                    if w is not None:
+                        break
+        return w
+
+    def _logits(self, tokens, weights=None):
+        spam, threat = self.spam_bias, self.threat_bias
+        seen = set()
+        if weights is None:
+            weights = self.weights
+        for i, tok in enumerate(tokens):
+            w = self._lookup(tok, weights)
+            if w is not None and tok not in seen:
+                seen.add(tok)
+                spam += w[0]
+                threat += w[1]
+            feature = tok
+            for n in range(1, min(self.max_ngram, len(tokens) - i)):
+                feature = feature + " " + tokens[i + n]
+                w = weights.get(feature)
+                if w is not None and feature not in seen:
+                    seen.add(feature)
+                    spam += w[0]
+                    threat += w[1]
+        return spam, threat
+
+    def score(self, text):
+        """Return {"spam": p, "threat": p} for one message."""
+        spam, threat = self._logits(tokenize(text))
+        return {"spam": _sigmoid(spam), "threat": _sigmoid(threat)}
+
+    def _category(self, spam, threat):
+        if _sigmoid(threat) >= self.threshold:
+            return "threat"
+        if _sigmoid(spam) >= self.threshold:
+            return "spam"
+        return "normal"
+
+    def classify(self, text):
+        """Return "threat", "spam" or "normal"."""
+        return self._category(*self._logits(tokenize(text)))
+
+    def is_threat(self, text):
+        """Threat check alone: only features with a threat weight are looked up."""
+        return _sigmoid(self._logits(tokenize(text), self._threat_weights)[1]) >= self.threshold
+
+    def classify_batch(self, texts):
+        """Classify many messages; tokenizes the whole batch in one regex pass."""
+        if not texts:
+            return []
+        # Newlines become message boundaries: bodies have theirs blanked out,
+        # so every "\n" token in the joined text starts the next message.
+        joined = "\n".join((t or "").replace("\n", " ") for t in texts).lower()
+        categories = []
+        tokens = []
+        for tok in _BATCH_TOKEN_RE.findall(joined):
+            if tok == "\n":
+                categories.append(self._category(*self._logits(tokens)))
+                tokens = []
+            else:
+                tokens.append(tok)
+        categories.append(self._category(*self._logits(tokens)))
+        return categories
+
+
+def load_scorer(path):
+    """
+    Load the weight table at `path`. A missing or unreadable table gives an
+    empty scorer, which then only knows the keywords added via with_keywords().
+    """
+    if not os.path.exists(path):
+        return SpamScorer()
+    try:
+        return SpamScorer.from_file(path)
+    except (OSError, ValueError) as e:
+        print("Failed to load spam weights:", e)
+        return SpamScorer()